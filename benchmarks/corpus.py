@@ -0,0 +1,196 @@
+"""Generates synthetic lingcorp projects for benchmarking.
+
+The vocabulary follows a Zipfian distribution.  Word forms are analyzed by a
+stand-in for the uniparser analyzer, a small share of them ambiguously, and
+all records come with GRAID and RefIND annotations.
+"""
+import csv
+import json
+import random
+from itertools import accumulate
+from pathlib import Path
+
+from writio import dump
+
+SYLLABLES = ["ka", "to", "mi", "re", "su", "na", "po", "li", "we", "ja", "ku", "se"]
+SUFFIXES = [("", "", ["sg"]), ("n", "PL", ["pl"]), ("ri", "LOC", ["loc"])]
+VERB_SUFFIXES = [("", "", ["prs"]), ("ke", "PST", ["pst"]), ("sa", "3SG", ["3sg"])]
+GRAID = [
+    ("np:s", 8),
+    ("np.h:a", 6),
+    ("np:p", 8),
+    ("pro.h:s", 4),
+    ("v:pred", 12),
+    ("other", 10),
+    ("", 20),
+    ("#rc np:p", 2),
+    ("0.h:a v:pred", 3),
+    ("np:l", 2),
+]
+
+CONF = '''import json
+from pathlib import Path
+
+from lingcorp import Cleaner, Tokenizer, UniParser
+
+ANALYSES = json.loads(Path(__file__).with_name("analyses.json").read_text())
+
+
+class StandInWordform:
+    def __init__(self, analysis):
+        self.analysis = analysis
+
+    def to_json(self):
+        return dict(self.analysis)
+
+
+class StandInGrammar:
+    paradigms = ["stand-in"]
+
+
+class StandInAnalyzer:
+    """Looks up precomputed uniparser-style analyses."""
+
+    g = StandInGrammar()
+
+    def analyze_words(self, words):
+        return [
+            [
+                StandInWordform(x)
+                for x in ANALYSES.get(
+                    w, [{{"wf": w, "wfGlossed": "", "gloss": "", "lemma": "", "gramm": []}}]
+                )
+            ]
+            for w in words
+        ]
+
+
+pipeline = [
+    {{"key": "ort", "label": "Primary_Text", "lvl": "record"}},
+    {{"key": "txt", "label": "Text_ID", "lvl": "record"}},
+    {{"key": "spk", "label": "Speaker_ID", "lvl": "record"}},
+    {{"key": "lng", "label": "Language_ID", "lvl": "record"}},
+    {{"key": "ftr", "label": "Translated_Text", "lvl": "translations", "file": "ftr.yaml", "edit": True}},
+    Cleaner(parse_col="ort", output_col="srf", strip=[".", ","]),
+    Tokenizer(parse_col="srf", output_col="srf"),
+    UniParser(StandInAnalyzer(), name="morpho", use_cache={use_cache}),
+    {{"key": "srf", "label": "Tokenized", "lvl": "word"}},
+    {{"key": "obj", "label": "Analyzed_Word", "lvl": "word"}},
+    {{"key": "gls", "label": "Gloss", "lvl": "word"}},
+    {{"key": "lex", "label": "Lexeme_IDs", "lvl": "word"}},
+    {{"key": "grm", "label": "Gramm", "lvl": "word"}},
+    {{"key": "mid", "label": "Morpheme_IDs", "lvl": "word"}},
+    {{"key": "pos", "label": "Part_Of_Speech", "lvl": "word"}},
+    {{"key": "wid", "label": "Wordform_ID", "lvl": "word"}},
+    {{"key": "graid", "label": "GRAID", "lvl": "word", "file": "graid.yaml", "ref": "srf", "edit": True}},
+    {{"key": "refind", "lvl": "word", "file": "refind.yaml", "ref": "graid", "edit": True}},
+]
+pos_list = ["n", "vt", "vi"]
+config = {{"audio_path": "audio", "output_file": "parsed.csv"}}
+'''
+
+
+def zipf_sampler(rng, items, exponent):
+    weights = list(
+        accumulate(1 / (rank**exponent) for rank in range(1, len(items) + 1))
+    )
+    return lambda k: rng.choices(items, cum_weights=weights, k=k)
+
+
+def make_vocabulary(rng, size, ambiguity):
+    """Word forms with one or more stand-in uniparser analyses."""
+    analyses = {}
+    lexeme = 0
+    while len(analyses) < size:
+        lexeme += 1
+        stem = "".join(rng.choices(SYLLABLES, k=rng.randint(1, 3)))
+        verb = rng.random() < 0.3
+        pos = rng.choice(["vt", "vi"]) if verb else "n"
+        gloss = f"{'do' if verb else 'thing'}{lexeme}"
+        for suffix, suffix_gloss, gramm in VERB_SUFFIXES if verb else SUFFIXES:
+            wf = stem + suffix
+            analysis = {
+                "wf": wf,
+                "wfGlossed": f"{stem}-{suffix}" if suffix else stem,
+                "gloss": f"{gloss}-{suffix_gloss}" if suffix else gloss,
+                "lemma": stem,
+                "gramm": [pos] + gramm,
+                "id": f"l{lexeme},s{suffix_gloss or 0}" if suffix else f"l{lexeme}",
+            }
+            if wf in analyses:
+                if rng.random() < ambiguity:
+                    analyses[wf].append(analysis)
+                continue
+            analyses[wf] = [analysis]
+    return dict(list(analyses.items())[:size])
+
+
+def generate(
+    path,
+    records=1000,
+    words=8,
+    vocabulary=2000,
+    exponent=1.1,
+    texts=10,
+    referents=40,
+    ambiguity=0.5,
+    use_cache=False,
+    seed=1,
+):
+    """Writes a lingcorp project with a synthetic corpus to `path`."""
+    rng = random.Random(seed)
+    path = Path(path)
+    for subdir in ["input", "output", "audio"]:
+        (path / subdir).mkdir(parents=True, exist_ok=True)
+    analyses = make_vocabulary(rng, vocabulary, ambiguity)
+    sample_words = zipf_sampler(rng, list(analyses), exponent)
+    sample_referents = zipf_sampler(rng, [f"r{i}" for i in range(referents)], 1.0)
+    graid_values, graid_weights = zip(*GRAID)
+    graid, refind = {}, {}
+    rows = []
+    for i in range(records):
+        rec_id = f"rec{i}"
+        text_id = f"text{i * texts // records}"
+        forms = sample_words(max(1, int(rng.gauss(words, words / 4))))
+        rows.append(
+            {
+                "ID": rec_id,
+                "Primary_Text": " ".join(forms) + ".",
+                "Text_ID": text_id,
+                "Speaker_ID": f"spk{rng.randint(1, 3)}",
+                "Language_ID": "synth",
+                "Translated_Text": f"translation of {rec_id}",
+            }
+        )
+        graid[rec_id], refind[rec_id] = {}, {}
+        for idx, form in enumerate(forms):
+            ann = rng.choices(graid_values, weights=graid_weights)[0]
+            if idx == 0:
+                ann = f"## {ann}".strip()
+            graid[rec_id][idx] = {form: ann}
+            refs = [
+                sample_referents(1)[0] if rng.random() < 0.8 else ""
+                for x in ann.split(" ")
+                if ":" in x and not x.startswith("v:") and x.split(":")[1] != "pred"
+            ]
+            if refs:
+                refind[rec_id][idx] = {ann: " ".join(refs)}
+    with open(path / "input" / "corpus.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    dump(graid, path / "graid.yaml")
+    dump(refind, path / "refind.yaml")
+    dump({}, path / "ftr.yaml")
+    (path / "analyses.json").write_text(json.dumps(analyses), encoding="utf-8")
+    (path / "conf.py").write_text(CONF.format(use_cache=use_cache), encoding="utf-8")
+    return {
+        "records": records,
+        "words": words,
+        "vocabulary": len(analyses),
+        "exponent": exponent,
+        "texts": texts,
+        "referents": referents,
+        "ambiguity": ambiguity,
+        "seed": seed,
+    }
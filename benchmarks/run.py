@@ -0,0 +1,222 @@
+"""Benchmarks for the pipeline, search and server hot paths.
+
+    python benchmarks/run.py run --records 2000 --output baseline.json
+    python benchmarks/run.py run --records 2000 --output patched.json
+    python benchmarks/run.py compare baseline.json patched.json
+
+Every benchmark runs on a synthetic corpus (see `corpus.py`) in a temporary
+project directory.  Results contain all timings as well as their minimum and
+median, in seconds.
+"""
+import importlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import generate  # noqa: E402
+
+QUERIES = {
+    "single_token": '[obj="{form}"]',
+    "multi_token": '[pos="n"][pos="vt"]',
+    "wildcard": '[gls="*-PL"]',
+}
+
+
+def measure(func, repeat, setup=None):
+    """Times `func` `repeat` times; `setup` is run untimed before each call,
+    its return value is passed on to `func`."""
+    runs = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        runs.append(time.perf_counter() - start)
+    return {
+        "runs": [round(x, 6) for x in runs],
+        "min": round(min(runs), 6),
+        "median": round(statistics.median(runs), 6),
+    }
+
+
+def load_project(path):
+    """Makes the `conf` module of the project at `path` importable."""
+    os.chdir(path)
+    sys.path.insert(0, str(path))
+    for module in ["conf", "lingcorp.server"]:
+        sys.modules.pop(module, None)
+    return importlib.import_module("conf")
+
+
+def bench_pipeline(conf, repeat, results):
+    from lingcorp.cli import parse_csvs
+    from lingcorp.helpers import load_data, run_pipeline
+
+    fields = {x["key"]: x for x in conf.pipeline if isinstance(x, dict)}
+    results["load_data"] = measure(lambda: load_data(fields), repeat)
+    results["run_pipeline"] = measure(
+        lambda data: run_pipeline(data, {}, conf.pipeline, conf.pos_list),
+        repeat,
+        setup=lambda: (load_data(fields),),
+    )
+    results["parse_csvs"] = measure(
+        lambda: parse_csvs(conf.pipeline, "parsed.csv", pos_list=conf.pos_list),
+        1,
+    )
+
+
+def bench_search(repeat, results):
+    from lingcorp.search import CorpusFrame
+
+    path = "output/parsed.csv"
+    results["corpusframe"] = measure(
+        lambda: CorpusFrame(path, list_cols=["mid", "grm"]), repeat
+    )
+    df = CorpusFrame(path, list_cols=["mid", "grm"])
+    form = df["obj"].explode().value_counts().index[0]
+    for name, query in QUERIES.items():
+        query = query.format(form=form)
+        results[f"query_{name}"] = measure(
+            lambda: df.query(query, mode="bare", conc_mode="csv"), repeat
+        )
+        results[f"query_{name}"]["query"] = query
+    queries = {name: query.format(form=form) for name, query in QUERIES.items()}
+    results["query_batch"] = measure(lambda: df.query_batch(queries), repeat)
+    return form
+
+
+def bench_server(repeat, results, form):
+    start = time.perf_counter()
+    server = importlib.import_module("lingcorp.server")
+    results["server_startup"] = {"runs": [round(time.perf_counter() - start, 6)]}
+    results["server_startup"]["min"] = results["server_startup"]["runs"][0]
+    results["server_startup"]["median"] = results["server_startup"]["runs"][0]
+    client = server.app.test_client()
+    rec_ids = list(server.data.index)
+    rec_id = rec_ids[len(rec_ids) // 2]
+
+    def get(url, **params):
+        response = client.get(url, query_string=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+
+    results["route_search"] = measure(
+        lambda: get(
+            "/search",
+            query=json.dumps(QUERIES["single_token"].format(form=form)),
+            filename=json.dumps("parsed.csv"),
+        ),
+        repeat,
+    )
+    results["route_example"] = measure(
+        lambda: get("/example", id=rec_id),
+        repeat,
+        setup=lambda: server.rendered.clear() or (),
+    )
+    results["route_textpage"] = measure(
+        lambda: get("/textpage", textID=server.data["txt"].iloc[0]),
+        repeat,
+        setup=lambda: server.rendered.clear() or (),
+    )
+    results["route_update"] = measure(
+        lambda: get("/update", target=f"{rec_id}_graid_0", value="## np.h:s"),
+        repeat,
+    )
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option("--records", default=1000, help="Number of records.")
+@click.option("--words", default=8, help="Mean number of words per record.")
+@click.option("--vocabulary", default=2000, help="Number of distinct word forms.")
+@click.option("--exponent", default=1.1, help="Exponent of the Zipf distribution.")
+@click.option("--repeat", default=3, help="Timed runs per benchmark.")
+@click.option("--seed", default=1)
+@click.option("--skip", multiple=True, type=click.Choice(["search", "server"]))
+@click.option("--path", type=click.Path(), help="Project directory to keep.")
+@click.option("--output", "-o", type=click.Path(), help="JSON file for the results.")
+@click.option("--verbose", is_flag=True, help="Show lingcorp's log messages.")
+def run(
+    records, words, vocabulary, exponent, repeat, seed, skip, path, output, verbose
+):
+    """Runs the benchmarks on a synthetic corpus."""
+    if not verbose:
+        logging.disable(logging.WARNING)
+    if output:
+        output = Path(output).resolve()
+    cwd = Path.cwd()
+    tmp = None
+    if not path:
+        tmp = tempfile.TemporaryDirectory(prefix="lingcorp-bench-")
+        path = tmp.name
+    path = Path(path).resolve()
+    params = generate(
+        path,
+        records=records,
+        words=words,
+        vocabulary=vocabulary,
+        exponent=exponent,
+        seed=seed,
+    )
+    results = {}
+    try:
+        conf = load_project(path)
+        bench_pipeline(conf, repeat, results)
+        if "search" not in skip:
+            form = bench_search(repeat, results)
+            if "server" not in skip:
+                bench_server(repeat, results, form)
+    finally:
+        os.chdir(cwd)
+        if tmp:
+            tmp.cleanup()
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {**params, "repeat": repeat},
+        "results": results,
+    }
+    click.echo(f"{'benchmark':<24} {'min':>10} {'median':>10}")
+    for name, result in results.items():
+        click.echo(f"{name:<24} {result['min']:>10.4f} {result['median']:>10.4f}")
+    if output:
+        output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        click.echo(f"Wrote results to {output}")
+
+
+@main.command()
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("contender", type=click.Path(exists=True))
+def compare(baseline, contender):
+    """Compares the median timings of two result files."""
+    old = json.loads(Path(baseline).read_text(encoding="utf-8"))
+    new = json.loads(Path(contender).read_text(encoding="utf-8"))
+    if old["params"] != new["params"]:
+        click.echo("Warning: the results were produced with different parameters")
+    click.echo(f"{'benchmark':<24} {'baseline':>10} {'contender':>10} {'speedup':>8}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before, after = old["results"][name]["median"], result["median"]
+        speedup = f"{before / after:.2f}x" if after else ""
+        click.echo(f"{name:<24} {before:>10.4f} {after:>10.4f} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
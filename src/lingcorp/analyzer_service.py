@@ -0,0 +1,207 @@
+"""A long-lived uniparser analyzer, shared by all processes of a project.
+
+    lingcorp analyzer path/to/grammar
+
+loads the grammar once and answers batches of words over local HTTP.
+`get_analyzer` returns a client for it if it is running, and a freshly loaded
+uniparser `Analyzer` otherwise.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from flask import Flask, request
+
+from lingcorp.annotator import WordMemo
+from lingcorp.grammar import GRAMMAR_FILES, GrammarSnapshot
+
+log = logging.getLogger(__name__)
+
+DEFAULT_URL = "http://127.0.0.1:5003"
+
+
+def load_analyzer(path="."):
+    """A uniparser `Analyzer` with the grammar files found in `path`."""
+    from uniparser_morph import Analyzer
+
+    analyzer = Analyzer()
+    for att, filename in GRAMMAR_FILES.items():
+        filepath = Path(path) / filename
+        if filepath.is_file():
+            setattr(analyzer, att, str(filepath))
+    analyzer.load_grammar()
+    return analyzer
+
+
+class AnalyzerService:
+    """Analyzes words with a grammar that is loaded once and reloaded when
+    one of its files changes (checked at most every `check_interval`
+    seconds).  Analyses are memoized per word form; on reloading, only the
+    forms the changes can affect are dropped."""
+
+    check_interval = 1
+
+    def __init__(self, path=".", cache_size=200000):
+        self.path = Path(path)
+        self.cache_size = cache_size
+        self.lock = threading.RLock()
+        self.analyzer = None
+        self.memo = WordMemo(cache_size)
+        self.mtimes = None
+        self.grammar = None
+        self.version = 0
+        self.requests = 0
+        self._checked = 0
+
+    def grammar_mtimes(self):
+        return {
+            filename: (self.path / filename).stat().st_mtime_ns
+            for filename in GRAMMAR_FILES.values()
+            if (self.path / filename).is_file()
+        }
+
+    def load(self):
+        with self.lock:
+            mtimes = self.grammar_mtimes()
+            start = time.perf_counter()
+            self.analyzer = load_analyzer(self.path)
+            grammar = GrammarSnapshot.read(self.path)
+            if self.grammar is not None:
+                forms = {
+                    form: {x["lemma"] for x in wf_analysis}
+                    for form, wf_analysis in self.memo.data.items()
+                }
+                affected = grammar.affected_forms(self.grammar, forms)
+                if affected is None:
+                    self.memo = WordMemo(self.cache_size)
+                else:
+                    for form in affected:
+                        del self.memo.data[form]
+            self.grammar = grammar
+            self.mtimes = mtimes
+            self.version += 1
+            log.info(
+                f"Loaded grammar from {self.path} in {time.perf_counter() - start:0.2f} seconds"
+            )
+
+    def check(self):
+        """Reloads the grammar if its files have changed."""
+        now = time.monotonic()
+        if self.analyzer is not None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        if self.analyzer is None or self.grammar_mtimes() != self.mtimes:
+            self.load()
+
+    def analyze(self, words):
+        """Analyses (as dicts) for `words`; unknown forms are analyzed in a
+        single call to the analyzer."""
+        with self.lock:
+            self.check()
+            self.requests += 1
+            new = [w for w in dict.fromkeys(words) if w not in self.memo.data]
+            analyses = {}
+            if new:
+                for word, wf_analysis in zip(new, self.analyzer.analyze_words(new)):
+                    analyses[word] = [x.to_json() for x in wf_analysis]
+            return [self.memo.get(w, lambda: analyses[w]) for w in words]
+
+    def status(self):
+        return {
+            "path": str(self.path.resolve()),
+            "version": self.version,
+            "requests": self.requests,
+            "cached": len(self.memo.data),
+            "hits": self.memo.hits,
+            "misses": self.memo.misses,
+        }
+
+
+def create_app(service):
+    app = Flask(__name__)
+
+    @app.route("/analyze", methods=["POST"])
+    def analyze():
+        return {"analyses": service.analyze(request.get_json()["words"])}
+
+    @app.route("/status")
+    def status():
+        return service.status()
+
+    return app
+
+
+def serve(path=".", host="127.0.0.1", port=5003):
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    service = AnalyzerService(path)
+    service.load()
+    create_app(service).run(host=host, port=port, threaded=True)
+
+
+class Analysis(dict):
+    """An analysis returned by the service, standing in for a `Wordform`."""
+
+    def to_json(self):
+        return dict(self)
+
+
+class RemoteAnalyzer:
+    """A client for an analyzer service, usable in place of a uniparser
+    `Analyzer`.  Words are sent in batches of `batch_size`."""
+
+    def __init__(self, url=DEFAULT_URL, timeout=300, batch_size=5000):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+    def _request(self, route, payload=None, timeout=None):
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.url + route, data=data, headers=headers)
+        with urllib.request.urlopen(req, timeout=timeout or self.timeout) as response:
+            return json.loads(response.read())
+
+    def analyze_words(self, words, **kwargs):
+        single = isinstance(words, str)
+        if single:
+            words = [words]
+        words = list(words)
+        res = []
+        for i in range(0, len(words), self.batch_size):
+            batch = words[i : i + self.batch_size]
+            res.extend(self._request("/analyze", {"words": batch})["analyses"])
+        res = [[Analysis(x) for x in wf_analysis] for wf_analysis in res]
+        return res[0] if single else res
+
+    def status(self, timeout=None):
+        """The service's status, or None if it is not running."""
+        try:
+            return self._request("/status", timeout=timeout)
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+
+def get_analyzer(path=".", url=None):
+    """A `RemoteAnalyzer` if an analyzer service for the grammar in `path`
+    answers at `url` (default: `$LINGCORP_ANALYZER` or `DEFAULT_URL`),
+    otherwise the grammar loaded with `load_analyzer`."""
+    remote = RemoteAnalyzer(url or os.environ.get("LINGCORP_ANALYZER", DEFAULT_URL))
+    status = remote.status(timeout=1)
+    if status and status["path"] == str(Path(path).resolve()):
+        log.info(f"Using the analyzer service at {remote.url}")
+        return remote
+    if status:
+        log.warning(
+            f"The analyzer service at {remote.url} uses the grammar in {status['path']}, loading {path}"
+        )
+    elif url:
+        log.warning(f"No analyzer service at {url}, loading the grammar")
+    return load_analyzer(path)
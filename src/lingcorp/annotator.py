@@ -1,13 +1,19 @@
+import hashlib
 import logging
 import re
 import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
 from pathlib import Path
 
 import pandas as pd
-from segments import Profile, Tokenizer
+from segments import Profile
+from segments import Tokenizer as SegmentTokenizer
 from writio import dump, load
 
 from lingcorp.config import ID_KEY
+from lingcorp.disambiguation import DisambiguationQueue
+from lingcorp.grammar import GrammarSnapshot
 from lingcorp.helpers import uniparser_fields
 
 log = logging.getLogger(__name__)
@@ -28,6 +34,10 @@ class Annotator:
     def save(self):
         pass
 
+    def cache_stats(self):
+        """Hit and miss counts of the caches used by the annotator, by name."""
+        return {}
+
 
 class Tokenizer(Annotator):
     def __init__(self, name="tokenizer", parse_col="srf", output_col="srf", **kwargs):
@@ -40,12 +50,83 @@ class Tokenizer(Annotator):
         return record
 
 
+class OrthoNormalizer:
+    """Applies `replace` and `strip` to strings and lowercases them, like
+    consecutive `str.replace` calls would, but compiled once and memoized.
+
+    If no replacement can affect the matching of a later one (keys do not
+    overlap; values neither share characters with later keys nor delete
+    material that could join into a longer later key), all replacements are
+    done in a single pass: `str.translate` if all keys are single characters,
+    one compiled longest-first alternation otherwise.  If they can interact,
+    the replacements are applied one after the other, as before.
+    """
+
+    def __init__(self, replace=None, strip=None, cache_size=100000):
+        self.rules = list((replace or {}).items()) + [(p, "") for p in strip or []]
+        self.single_pass = self._independent(self.rules)
+        if not self.single_pass:
+            log.debug("Interacting replacements, normalizing sequentially")
+            self._replace = self._replace_sequentially
+        elif all(len(k) == 1 for k, v in self.rules):
+            table = str.maketrans(dict(self.rules))
+            self._replace = lambda s: s.translate(table)
+        else:
+            table = dict(self.rules)
+            pattern = re.compile(
+                "|".join(re.escape(k) for k in sorted(table, key=len, reverse=True))
+            )
+            self._replace = lambda s: pattern.sub(lambda m: table[m.group()], s)
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    @staticmethod
+    def _independent(rules):
+        keys = [k for k, v in rules]
+        if "" in keys or len(set(keys)) != len(keys):
+            return False
+        for a in keys:
+            for b in keys:
+                if a == b:
+                    continue
+                if a in b:
+                    return False
+                for i in range(1, min(len(a), len(b))):
+                    if a[-i:] == b[:i]:
+                        return False
+        for i, (_, value) in enumerate(rules):
+            for later, _ in rules[i + 1 :]:
+                if set(value) & set(later) or (not value and len(later) > 1):
+                    return False
+        return True
+
+    def _replace_sequentially(self, ortho_str):
+        for k, v in self.rules:
+            ortho_str = ortho_str.replace(k, v)
+        return ortho_str
+
+    def _normalize(self, ortho_str):
+        return self._replace(ortho_str).lower()
+
+    def __call__(self, ortho_str):
+        return self.normalize(ortho_str)
+
+    def cache_stats(self):
+        info = self.normalize.cache_info()
+        return {"hits": info.hits, "misses": info.misses}
+
+
+@lru_cache(maxsize=None)
+def _get_normalizer(replace, strip):
+    return OrthoNormalizer(dict(replace), list(strip))
+
+
+def get_normalizer(replace={}, strip=[]):
+    """A shared OrthoNormalizer for the given configuration."""
+    return _get_normalizer(tuple(replace.items()), tuple(strip))
+
+
 def ortho_strip(ortho_str, replace={}, strip=[]):
-    for k, v in replace.items():
-        ortho_str = ortho_str.replace(k, v)
-    for p in strip:
-        ortho_str = ortho_str.replace(p, "")
-    return ortho_str.lower()
+    return get_normalizer(replace, strip)(ortho_str)
 
 
 class Cleaner(Annotator):
@@ -63,13 +144,15 @@ class Cleaner(Annotator):
         self.output_col = output_col
         self.strip = strip
         self.replace = replace
+        self.normalizer = get_normalizer(replace, strip)
 
     def parse(self, rec):
-        rec[self.output_col] = ortho_strip(
-            rec[self.src], replace=self.replace, strip=self.strip
-        )
+        rec[self.output_col] = self.normalizer(rec[self.src])
         return rec
 
+    def cache_stats(self):
+        return {"normalizer": self.normalizer.cache_stats()}
+
 
 class UniParser(Annotator):
     def __init__(
@@ -80,17 +163,27 @@ class UniParser(Annotator):
         srf_strip=[",", ".", "!", "?", "¿"],
         use_cache=True,
         mask_ambiguity=False,
+        grammar_path=None,
         **kwargs,
     ):
         self.name = name
+        if isinstance(analyzer, (str, Path)):  # a grammar directory
+            from lingcorp.analyzer_service import get_analyzer
+
+            grammar_path = grammar_path or analyzer
+            analyzer = get_analyzer(analyzer)
+        elif hasattr(analyzer, "load_grammar"):
+            grammar_path = grammar_path or Path(analyzer.paradigmFile).parent
+            if len(analyzer.g.paradigms) == 0:
+                analyzer.load_grammar()
+        self.grammar_path = grammar_path
         self.analyzer = analyzer
         self.parse_col = parse_col
         self.annotated_path = f"{name}.yaml"
         self.mask_ambiguity = mask_ambiguity
         self.annotated = load(self.annotated_path) or {}
-        if len(analyzer.g.paradigms) == 0:
-            self.analyzer.load_grammar()
         self.srf_strip = srf_strip
+        self.srf_normalizer = get_normalizer(strip=srf_strip)
         if use_cache:
             start = time.perf_counter()
             self.cache_path = f"{name}_cache.pickle"
@@ -100,7 +193,62 @@ class UniParser(Annotator):
 
         else:
             self.cache = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.grammar = None
+        self.stale = {}  # record ID: positions of words to reanalyze
+        self.changed = set()  # records with reanalyzed words
+        if self.cache is not None and self.grammar_path:
+            self.check_grammar()
         self.unresolved = []
+        self.queue = DisambiguationQueue()
+
+    def check_grammar(self):
+        """Compares the grammar to the one the cache was built with, and marks
+        the cached words whose analyses the changes can affect (see
+        `GrammarSnapshot.affected_forms`) for reanalysis."""
+        self.grammar = GrammarSnapshot.read(self.grammar_path)
+        snapshot_path = Path(f"{self.name}_grammar.json")
+        if not self.cache or not snapshot_path.is_file():
+            return
+        forms = {}
+        for all_analyses in self.cache.values():
+            for wf_analysis in all_analyses:
+                for analysis in wf_analysis:
+                    forms.setdefault(analysis["wf"], set()).add(analysis["lemma"])
+        affected = self.grammar.affected_forms(
+            GrammarSnapshot.from_file(snapshot_path), forms
+        )
+        if affected is None:
+            log.info("The grammar has changed, clearing the cache")
+            self.cache.clear()
+            return
+        for rec_id, all_analyses in self.cache.items():
+            positions = [
+                i
+                for i, wf_analysis in enumerate(all_analyses)
+                if wf_analysis and wf_analysis[0]["wf"] in affected
+            ]
+            if positions:
+                self.stale[rec_id] = positions
+        if affected:
+            log.info(
+                f"The grammar has changed: reanalyzing {len(affected)} word forms in {len(self.stale)} records"
+            )
+
+    def reanalyze(self, record, all_analyses):
+        """Replaces the analyses of the stale words of `record`."""
+        positions = self.stale.pop(record[ID_KEY])
+        words = [record[self.parse_col][i] for i in positions]
+        fresh = self.analyzer.analyze_words(words)
+        all_analyses = list(all_analyses)
+        for i, wf_analysis in zip(positions, fresh):
+            wf_analysis = [x.to_json() for x in wf_analysis]
+            if wf_analysis != all_analyses[i]:
+                self.changed.add(record[ID_KEY])
+            all_analyses[i] = wf_analysis
+        self.cache[record[ID_KEY]] = all_analyses
+        return all_analyses
 
     def add_analysis(self, record, analysis, anas, ana, wf):
         if "," in wf:
@@ -113,7 +261,7 @@ class UniParser(Annotator):
                     record[target].append(wf)
                 else:
                     record[target].append(
-                        ortho_strip(analysis.get(field_name, ""), strip=self.srf_strip)
+                        self.srf_normalizer(analysis.get(field_name, ""))
                     )
             elif field_name == "wfGlossed":
                 if not analysis or unparsable:
@@ -146,12 +294,18 @@ class UniParser(Annotator):
         for field_name in ["obj", "gls", "lex", "grm", "mid", "ana", "anas"]:
             record[field_name] = []
         if self.cache and record[ID_KEY] in self.cache:
+            self.cache_hits += 1
             all_analyses = self.cache[record[ID_KEY]]
+            if record[ID_KEY] in self.stale:
+                all_analyses = self.reanalyze(record, all_analyses)
         else:
+            self.cache_misses += 1
             all_analyses = self.analyzer.analyze_words(record[self.parse_col])
             all_analyses = [[x.to_json() for x in y] for y in all_analyses]
-            self.cache[record[ID_KEY]] = all_analyses
+            if self.cache is not None:
+                self.cache[record[ID_KEY]] = all_analyses
         record[self.parse_col] = []
+        self.queue.discard_record(record[ID_KEY])
         for w_idx, wf_analysis in enumerate(all_analyses):
             analysis = None
             if len(wf_analysis) > 1:
@@ -161,7 +315,7 @@ class UniParser(Annotator):
                     exit()
                 anas = {"?": "?"}
                 ana = "?"
-                srf = ortho_strip(wf_analysis[0]["wf"], strip=self.srf_strip)
+                srf = self.srf_normalizer(wf_analysis[0]["wf"])
                 for potential_analysis in wf_analysis:
                     anas[potential_analysis["gloss"]] = {
                         uniparser_fields[k]: v
@@ -180,7 +334,7 @@ class UniParser(Annotator):
             elif len(wf_analysis) == 1:
                 log.debug(f"Using unambiguous analysis {wf_analysis[0]}")
                 analysis = wf_analysis[0]
-                srf = ortho_strip(analysis["wf"], strip=self.srf_strip)
+                srf = self.srf_normalizer(analysis["wf"])
                 ana = ""
                 anas = {}
             else:
@@ -196,16 +350,40 @@ class UniParser(Annotator):
                 self.unresolved.append(
                     {"rec": record[ID_KEY], "form": srf, "txt": record["txt"]}
                 )
+                self.queue.add(
+                    record[ID_KEY],
+                    w_idx,
+                    srf,
+                    [x["gloss"] for x in wf_analysis],
+                    txt=record["txt"],
+                )
             self.add_analysis(record, analysis, anas, ana, srf)
         return record
 
-    def register_choice(self, record_id, pos, obj, choice):
+    def cache_stats(self):
+        return {
+            "analyses": {"hits": self.cache_hits, "misses": self.cache_misses},
+            "srf_normalizer": self.srf_normalizer.cache_stats(),
+        }
+
+    def register_choice(self, record_id, pos, obj, choice, save=True):
         self.annotated.setdefault(record_id, {})
         self.annotated[record_id].setdefault(int(pos), {})
-        self.annotated[record_id][int(pos)][
-            ortho_strip(obj, strip=self.srf_strip)
-        ] = choice
-        dump(self.annotated, self.annotated_path)
+        self.annotated[record_id][int(pos)][self.srf_normalizer(obj)] = choice
+        self.queue.discard(record_id, int(pos))
+        if save:
+            dump(self.annotated, self.annotated_path)
+
+    def resolve(self, form, candidates, choice, overrides=None):
+        """Registers `choice` for all unresolved occurrences of `form` with
+        the given candidate analyses (see `DisambiguationQueue.resolve`).
+        Returns the decisions as `(record_id, pos, choice)`."""
+        decisions = self.queue.resolve(form, candidates, choice, overrides)
+        for record_id, pos, gloss in decisions:
+            self.register_choice(record_id, pos, form, gloss, save=False)
+        if decisions:
+            dump(self.annotated, self.annotated_path)
+        return decisions
 
     def discard_choice(self, record_id, pos):
         pos = int(pos)
@@ -220,12 +398,48 @@ class UniParser(Annotator):
 
     def save(self):
         if self.cache is not None:
+            if self.stale:  # not parsed since the grammar changed
+                log.info(f"Dropping {len(self.stale)} stale records from the cache")
+                for rec_id in self.stale:
+                    self.cache.pop(rec_id, None)
+                self.stale.clear()
             start = time.perf_counter()
             dump(self.cache, self.cache_path)
             end = time.perf_counter()
             print(f"Dumped cache in {end - start:0.4f} seconds")
+            if self.grammar is not None:
+                dump(self.grammar.to_data(), f"{self.name}_grammar.json")
+            if self.changed:
+                log.info(f"Changed analyses in {len(self.changed)} records")
         if self.unresolved is not None:
             dump(pd.DataFrame.from_dict(self.unresolved), f"{self.name}_unresolved.csv")
+        dump(self.queue.to_frame(), f"{self.name}_queue.csv")
+
+
+class WordMemo:
+    """A bounded LRU memo, counting hits and misses."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        if key in self.data:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+        self.misses += 1
+        value = compute()
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+        return value
+
+
+# transliterated words, shared by all segmentizers with the same profile
+segment_memo = WordMemo()
 
 
 class Segmentizer(Annotator):
@@ -249,43 +463,131 @@ class Segmentizer(Annotator):
         self.name = name
         self.ignore = ignore
         self.delete = delete
+        self.target = target
+        self.convert_col = target
+        self.tokenize = tokenize
+        self.word_sep = word_sep
+        self.parse_col = parse_col
+        self.output_col = output_col
+        self.complain = complain
+        self.segments = None
         if file:
-            self.segments = load(kwargs["file"])
+            self.segments = load(file)
         elif segments:
             self.segments = segments
-        if not self.segments:
-            self.profile = profile
-        elif profile:
-            self.segments = []
+        if self.segments:
             self.profile = Profile(
-                *self.segments
+                *[dict(x) for x in self.segments]
                 + [{"Grapheme": ig, self.convert_col: ig} for ig in self.ignore]
                 + [{"Grapheme": de, self.convert_col: ""} for de in self.delete]
             )
+        else:
+            self.profile = profile
         if tokenizer:
             self.tokenizer = tokenizer
+            self.profile_key = id(tokenizer)
+        else:
+            self.tokenizer = SegmentTokenizer(
+                self.profile, errors_replace=self._replace_unknown
+            )
+            self.profile_key = hashlib.md5(str(self.profile).encode()).hexdigest()
+        self._unknown = []
+        self.unconvertible = {}  # word: unknown graphemes
+        self.unconvertible_counts = Counter()
+
+    def _replace_unknown(self, grapheme):
+        if grapheme != "�":  # not found in the target column either
+            self._unknown.append(grapheme)
+        return "�"
+
+    def _convert_word(self, word):
+        self._unknown = []
+        if self.tokenize:
+            res = self.tokenizer(word, column=self.target)
         else:
-            self.tokenizer = Tokenizer(self.profile)
+            res = self.tokenizer(
+                word,
+                column=self.convert_col,
+                segment_separator="",
+                separator=self.word_sep,
+            )
+        if "�" in res:
+            return res, tuple(self._unknown) or ("?",)
+        return res, ()
+
+    def parse_word(self, word):
+        res, unknown = segment_memo.get(
+            (self.profile_key, self.tokenize, self.target, self.word_sep, word),
+            lambda: self._convert_word(word),
+        )
+        if unknown and self.complain:
+            self.unconvertible[word] = unknown
+            self.unconvertible_counts[word] += 1
+        return res
 
     def parse_string(self, input_str):
+        """Transliterates a string word by word, each distinct word only once."""
         if self.tokenize:
-            res = re.sub(" +", " ", self.tokenizer(input_str, column=self.target))
-            if self.complain and "�" in res:
-                log.warning(f"Could not convert {input_str}: {res}")
+            res = " # ".join(self.parse_word(x) for x in input_str.split())
+            if "  " in res:
+                res = re.sub(" +", " ", res)
             return res
-        res = self.tokenizer(
-            input_str,
-            column=self.convert_col,
-            segment_separator="",
-            separator=self.word_sep,
-        )
-        if self.complain and "�" in res:
-            log.warning(f"Could not convert {input_str}: {res}")
+        return self.word_sep.join(self.parse_word(x) for x in input_str.split())
+
+    def parse_column(self, column):
+        """Transliterates a column of strings or word lists at once."""
+        converted = {}
+        res = []
+        for value in column:
+            if isinstance(value, list):
+                for x in value:
+                    if x not in converted:
+                        converted[x] = self.parse_string(x)
+                    elif self.complain:
+                        for word in x.split():
+                            if word in self.unconvertible:
+                                self.unconvertible_counts[word] += 1
+                res.append([converted[x] for x in value])
+            else:
+                res.append(self.parse_string(value))
         return res
 
+    def parse_records(self, records):
+        """Transliterates `parse_col` of all records, used by `run_pipeline`."""
+        column = self.parse_column([rec[self.parse_col] for rec in records])
+        for rec, value in zip(records, column):
+            rec[self.output_col] = value
+        return records
+
+    def report(self):
+        """Logs all untransliterable graphemes, with token counts and examples."""
+        graphemes = {}
+        for word, unknown in self.unconvertible.items():
+            for grapheme in set(unknown):
+                graphemes.setdefault(grapheme, Counter())
+                graphemes[grapheme][word] += self.unconvertible_counts[word]
+        if not graphemes:
+            return
+        lines = []
+        for grapheme, words in sorted(
+            graphemes.items(), key=lambda x: sum(x[1].values()), reverse=True
+        ):
+            examples = ", ".join(w for w, _ in words.most_common(3))
+            lines.append(f"{grapheme}: {sum(words.values())} tokens (e.g. {examples})")
+        log.warning(
+            f"{self.name}: could not convert {len(graphemes)} grapheme(s):\n"
+            + "\n".join(lines)
+        )
+
+    def save(self):
+        self.report()
+
+    def cache_stats(self):
+        return {"segments": {"hits": segment_memo.hits, "misses": segment_memo.misses}}
+
     def parse(self, record):
         if isinstance(record[self.parse_col], list):
-            record[self.parse_col] = [
+            record[self.output_col] = [
                 self.parse_string(x) for x in record[self.parse_col]
             ]
         else:
@@ -9,7 +9,10 @@ from cookiecutter.main import cookiecutter
 
 import lingcorp
 from lingcorp.config import INPUT_DIR, OUTPUT_DIR
-from lingcorp.helpers import get_pos, load_data, run_pipeline
+from lingcorp.export import Exporter
+from lingcorp.helpers import get_pos, load_data, profile_stage, run_pipeline
+from lingcorp.profiling import PipelineProfiler
+from lingcorp.stats import MEASURES
 
 handler = colorlog.StreamHandler(None)
 handler.setFormatter(
@@ -34,15 +37,88 @@ def main():
 @main.command()
 @click.option("--limit", default=None, type=int)
 @click.option("--text", default=None)
-def cli(limit, text):
+@click.option("--profile", is_flag=True, help="Print a timing report per stage.")
+@click.option("--profile-json", default=None, help="Write the timing report to a file.")
+@click.option("--no-memory", is_flag=True, help="Do not measure peak memory.")
+def cli(limit, text, profile, profile_json, no_memory):
     from conf import config, pipeline, pos_list
 
+    profiler = None
+    if profile or profile_json:
+        profiler = PipelineProfiler(memory=not no_memory)
     parse_csvs(
         pipeline,
         config.get("output_file", "parsed.csv"),
         config.get("filter", {}),
         pos_list,
+        profiler=profiler,
     )
+    if profiler:
+        profiler.stop()
+        print(profiler.report())
+        if profile_json:
+            profiler.dump(profile_json)
+
+
+@main.command()
+@click.argument("queries", type=click.Path(exists=True))
+@click.option("--data", default=None, help="Annotated corpus (default: output file).")
+@click.option(
+    "--format", "conc_mode", type=click.Choice(["csv", "html"]), default="csv"
+)
+@click.option("--processes", default=None, type=int, help="Search processes.")
+def query(queries, data, conc_mode, processes):
+    """Writes concordances for a YAML, JSON or CSV (name, query) list of queries."""
+    from conf import config
+    from writio import load
+
+    from lingcorp.search import CorpusFrame
+
+    queries = load(queries)
+    if not isinstance(queries, dict):
+        if hasattr(queries, "to_dict"):
+            queries = queries.to_dict("records")
+        queries = {x["name"]: x["query"] for x in queries}
+    data = data or OUTPUT_DIR / config.get("output_file", "parsed.csv")
+    df = CorpusFrame(data, list_cols=["mid", "grm"])
+    summary = df.query_batch(queries, conc_mode=conc_mode, processes=processes)
+    print(f"{'query':<32} {'hits':>7} {'seconds':>9}")
+    for name, res in summary.items():
+        print(f"{name[:32]:<32} {res['hits']:>7} {res['seconds']:>9.3f}")
+        if "error" in res:
+            print(res["error"])
+
+
+@main.command()
+@click.argument("col", default="obj")
+@click.option("--data", default=None, help="Annotated corpus (default: output file).")
+@click.option("-n", "--ngram", default=1, help="Count sequences of n values.")
+@click.option("--node", default=None, help="List collocates of this value.")
+@click.option("--node-col", default=None, help="Column of the node (default: COL).")
+@click.option("--window", default=3, help="Collocation window (words to each side).")
+@click.option("--measure", default="ll", type=click.Choice(MEASURES))
+@click.option("--top", default=50, help="Number of rows to show (0: all).")
+@click.option("--output", default=None, help="Write the full table to a file.")
+def stats(col, data, ngram, node, node_col, window, measure, top, output):
+    """Frequencies, n-grams or collocations of an aligned column."""
+    from conf import config
+    from writio import dump
+
+    from lingcorp.search import CorpusFrame
+
+    data = data or OUTPUT_DIR / config.get("output_file", "parsed.csv")
+    df = CorpusFrame(data, list_cols=["mid", "grm"])
+    if node:
+        res = df.collocations(
+            col, node, node_col=node_col, window=window, measure=measure
+        )
+    elif ngram > 1:
+        res = df.ngrams(col, n=ngram)
+    else:
+        res = df.frequencies(col)
+    print(res.head(top).to_string(index=False) if top else res.to_string(index=False))
+    if output:
+        dump(res, output)
 
 
 @main.command()
@@ -52,6 +128,17 @@ def web():
     run_server()
 
 
+@main.command()
+@click.argument("path", default=".", type=click.Path(exists=True, file_okay=False))
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=5003, type=int)
+def analyzer(path, host, port):
+    """Serves the uniparser grammar in PATH to all lingcorp processes."""
+    from lingcorp.analyzer_service import serve
+
+    serve(path, host=host, port=port)
+
+
 @main.command()
 @click.argument("name")
 def new(name):
@@ -66,30 +153,26 @@ def new(name):
         raise ValueError()
 
 
-def parse_csvs(pipeline, out_f, filter_params=None, pos_list=None):
+def parse_csvs(pipeline, out_f, filter_params=None, pos_list=None, profiler=None):
     fields = {x["key"]: x for x in pipeline if isinstance(x, dict)}
-    data = load_data(
-        fields=fields,
-        filter_params=filter_params,
-    )
+    with profile_stage(profiler, "load_data"):
+        data = load_data(
+            fields=fields,
+            filter_params=filter_params or {},
+        )
     annotations = {}
-    data = run_pipeline(data, annotations, pipeline, pos_list=pos_list or [])
-    for col in ["ana", "anas", "audio"]:
-        if col in data.columns:
-            data.drop(columns=[col], inplace=True)
-    for col, field in fields.items():
-        if (
-            field["lvl"] == "word"
-            and col in data.columns
-            and isinstance(data[col].iloc[0], list)
-        ):
-            if isinstance(data[col].iloc[0][0], list):
-                data[col] = data[col].apply(lambda x: [",".join(y) for y in x])
-            data[col] = data[col].apply(lambda x: "\t".join(x))
-    for key, field_data in fields.items():
-        if key in data.columns and "label" in field_data:
-            data.rename(columns={key: field_data["label"]}, inplace=True)
-    data.to_csv(OUTPUT_DIR / out_f, index=False)
+    data = run_pipeline(
+        data, annotations, pipeline, pos_list=pos_list or [], profiler=profiler
+    )
+    with profile_stage(profiler, "export", len(data)):
+        Exporter(
+            OUTPUT_DIR / out_f,
+            list_cols=[col for col, field in fields.items() if field["lvl"] == "word"],
+            drop=["ana", "anas", "audio"],
+            labels={
+                key: field["label"] for key, field in fields.items() if "label" in field
+            },
+        ).write(data)
 
     # nested_recs = []
     # for rec in records:
@@ -1,21 +1,27 @@
 import logging
+from itertools import groupby
 from pathlib import Path
 
+import pandas as pd
 import pygraid
 import questionary
 from humidifier import humidify
 from writio import dump, load
 
+from lingcorp.analyzer_service import get_analyzer
 from lingcorp.annotator import Annotator
 from lingcorp.config import GRAID_KEY, ID_KEY
+from lingcorp.disambiguation import DisambiguationQueue
 from lingcorp.helpers import (
     choose_from_list,
-    favorite,
     highlight_list,
     human_sort,
     pad_ex,
     print_record,
 )
+from lingcorp.interlinear import InterlinearLayout
+from lingcorp.session import SessionStore
+from lingcorp.suggestions import RankedCounter, SuggestionIndex
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
@@ -25,6 +31,12 @@ def repr_wf(wf):
     return f"{wf['wf']} '{wf['gloss']}'"
 
 
+def empty_analysis(wf):
+    """An analysis of `wf` without values, as for an unanalyzed uniparser
+    `Wordform` (which needs the grammar, unlike a `RemoteAnalyzer`)."""
+    return {"wf": wf, "lemma": "", "gramm": [], "wfGlossed": "", "gloss": ""}
+
+
 class CliAnnotator:
     fieldnames = {
         "id": ID_KEY,
@@ -36,6 +48,9 @@ class CliAnnotator:
         "text": "txt",
     }
     files = {"cache": {}}
+    batch = False  # pre-annotate all records before parsing them
+    min_count = 3  # how often a suggestion must have been given...
+    min_share = 0.9  # ...and its share of the answers, to be applied in batch mode
 
     def __init__(self, name="unnamed", interactive=True, **kwargs):
         self.name = name
@@ -66,6 +81,162 @@ class CliAnnotator:
                 else:
                     setattr(self, f, default)
 
+    def start_session(self, *targets, every=20, interval=30):
+        """Persists the `targets` attributes (to their `{target}_path`) through
+        a write-behind `SessionStore`; answers are passed to `record`."""
+        name = getattr(self, "name", None) or self.path.stem
+        self.session = SessionStore(
+            f"{name}_session.log", self.apply_entry, every=every, interval=interval
+        )
+        for target in targets:
+            self.session.register(
+                getattr(self, f"{target}_path"), lambda t=target: self.serialize(t)
+            )
+        self.session.start()
+
+    def record(self, target, op, path, value):
+        self.session.record(target, op, path, value)
+
+    def apply_entry(self, target, op, path, value):
+        """Applies a journaled change: `set` a value in the nested dicts of an
+        attribute, or `add` a value to a set or a `SuggestionIndex`."""
+        obj = getattr(self, target)
+        if op == "set":
+            for key in path[:-1]:
+                obj = obj.setdefault(key, {})
+            obj[path[-1]] = value
+        elif isinstance(obj, SuggestionIndex):
+            obj.add(path[0], value)
+        else:
+            obj.add(value)
+
+    def save(self):
+        self.session.flush()
+
+    def write(self):
+        self.session.close()
+
+    def serialize(self, target):
+        value = getattr(self, target)
+        if isinstance(value, SuggestionIndex):
+            return value.to_data()
+        if isinstance(value, set):
+            return sorted(value)
+        return value
+
+    def batch_items(self, rec):
+        """`(position, key, candidates)` for the items of `rec` to annotate;
+        `candidates` is a tuple of possible answers, or None."""
+        return []
+
+    def batch_suggestion(self, key, candidates):
+        return self.cache.confidence(key, candidates)
+
+    def applicable(self, answer, rec):
+        """Whether a suggested `answer` can be used in `rec`."""
+        return True
+
+    def is_annotated(self, rec_id, i, key):
+        return key in self.annotated.get(rec_id, {}).get(i, {})
+
+    def confident(self, key, candidates, rec):
+        answer, count, share = self.batch_suggestion(key, candidates)
+        if count >= self.min_count and share >= self.min_share:
+            if self.applicable(answer, rec):
+                return answer
+        return None
+
+    def preannotate(self, records):
+        """Applies the confident suggestions to all `records` as provisional
+        annotations and queues the other items, the most frequent keys first,
+        so that every answer can be reused as soon as possible.  The queue is
+        written to `{name}_queue.yaml` and, if interactive, reviewed."""
+        items = pd.DataFrame(
+            [
+                (n, rec[ID_KEY], i, key, candidates)
+                for n, rec in enumerate(records)
+                for i, key, candidates in self.batch_items(rec)
+                if not self.is_annotated(rec[ID_KEY], i, key)
+            ],
+            columns=["rec", "rec_id", "idx", "key", "candidates"],
+        )
+        self.queue = []
+        if items.empty:
+            return
+        suggestions = {
+            x: self.batch_suggestion(*x)
+            for x in set(zip(items["key"], items["candidates"]))
+        }
+        suggested = pd.DataFrame(
+            [suggestions[x] for x in zip(items["key"], items["candidates"])],
+            columns=["answer", "count", "share"],
+        )
+        items = pd.concat([items, suggested], axis=1)
+        items["frequency"] = items.groupby("key")["key"].transform("size")
+        confident = (
+            (items["count"] >= self.min_count) & (items["share"] >= self.min_share)
+        ).to_numpy()
+        for k in confident.nonzero()[0]:
+            confident[k] = self.applicable(
+                items["answer"].iat[k], records[items["rec"].iat[k]]
+            )
+        self.session.record_many(
+            [
+                ("provisional", "set", [rec_id, i, key], answer)
+                for rec_id, i, key, answer in items[confident][
+                    ["rec_id", "idx", "key", "answer"]
+                ].itertuples(index=False)
+            ]
+        )
+        queue = items[~confident].sort_values(
+            ["frequency", "key", "rec", "idx"], ascending=[False, True, True, True]
+        )
+        log.info(
+            f"{self.name}: applied {confident.sum()} suggestions, {len(queue)} items ({queue['key'].nunique()} distinct) left"
+        )
+        self.queue = queue[["rec", "rec_id", "idx", "key", "candidates"]].to_dict(
+            "records"
+        )
+        dump(
+            [
+                {"record": x["rec_id"], "position": x["idx"], "key": x["key"]}
+                for x in self.queue
+            ],
+            Path(f"{self.name}_queue.yaml"),
+        )
+        if self.interactive:
+            self.review(records)
+
+    def review(self, records):
+        """Asks for the queued items, one key after the other.  Once the
+        answers for a key are confident, its remaining items are applied
+        without asking."""
+        for key, items in groupby(self.queue, key=lambda x: x["key"]):
+            for item in items:
+                rec = records[item["rec"]]
+                answer = self.confident(key, item["candidates"], rec)
+                if answer is not None:
+                    self.record(
+                        "provisional", "set", [item["rec_id"], item["idx"], key], answer
+                    )
+                else:
+                    self.ask(rec, item["idx"], key, item["candidates"])
+        self.queue = []
+
+    def ask(self, rec, i, key, candidates=None):
+        """Prompts for the item `key` at position `i` of `rec`, with a choice
+        between the `candidates` if there are any."""
+        print_record(rec, highlight_pos=i)
+        if candidates:
+            answer = questionary.select(f"{key}:", choices=list(candidates)).ask()
+        else:
+            answer = questionary.text(f"{key}:").ask()
+        if answer is not None:
+            self.record("annotated", "set", [rec[ID_KEY], i, key], answer)
+            if isinstance(self.cache, SuggestionIndex):
+                self.cache.add(key, answer)
+        return answer
+
     def delete_annotation(self, record_id):
         if record_id in self.annotated:
             del self.annotated[record_id]
@@ -87,6 +258,8 @@ class RecordAnnotator(CliAnnotator):
         if target:
             self.target = target
         self.data_setup()
+        self.data_path = self.path
+        self.start_session("data")
 
     def print_record(self, record, **kwargs):
         print_record(record, **kwargs)
@@ -96,39 +269,70 @@ class RecordAnnotator(CliAnnotator):
         if data is None or self.fix:
             self.print_record(record)
             data = questionary.text(self.prompt, default=data or "").ask()
-            self.data[record[ID_KEY]] = data
+            self.record("data", "set", [record[ID_KEY]], data)
         record[self.target] = data or ""
-        dump(self.data, self.path)
         return record
 
-    def write(self):
-        dump(self.data, self.path)
-
 
 class WordAnnotator(CliAnnotator):
-    files = {"ignore": set(), "cache": {}, "annotated": {}, "skip": []}
+    files = {
+        "ignore": set(),
+        "cache": {},
+        "annotated": {},
+        "skip": [],
+        "provisional": {},
+    }
 
-    def __init__(self, fix=False, interactive=True, parse_col="obj", **kwargs):
+    def __init__(
+        self, fix=False, interactive=True, parse_col="obj", batch=False, **kwargs
+    ):
         self.data_setup(**kwargs)
+        self.cache = SuggestionIndex(self.cache)
         self.parse_col = parse_col
         self.fix = fix
         self.interactive = interactive
+        self.batch = batch
+        self.start_session("annotated", "cache", "ignore", "provisional")
 
-    def save(self):
-        sorted_dic = sorted(
-            self.annotated.items(), key=lambda item: human_sort(item[0])
-        )
-        sorted_dic = {k: v for (k, v) in sorted_dic if v}
-        dump(sorted_dic, self.annotated_path)
+    def serialize(self, target):
+        if target == "annotated":
+            sorted_dic = sorted(
+                self.annotated.items(), key=lambda item: human_sort(item[0])
+            )
+            return {k: v for (k, v) in sorted_dic if v}
+        return super().serialize(target)
 
     def identify(self, values):
         """A method for generating word identifiers"""
         return values[0] + ":" + values[1]
 
+    def word_ids(self, rec):
+        return [self.identify(values) for values in zip(*rec.values())]
+
+    def batch_items(self, rec):
+        return [
+            (i, wf_id, None)
+            for i, wf_id in enumerate(self.word_ids(rec))
+            if self.is_target(wf_id)
+        ]
+
+    def ask(self, rec, i, wf_id, candidates=None, pre_fill=None):
+        answer = self.prompt_at_position(
+            rec,
+            i,
+            prompt=f"Annotate?",
+            pre_fill=self.find_suggestion(wf_id, rec) if pre_fill is None else pre_fill,
+        )
+        if answer == "ignore":  # annotate nothing and never ask again
+            self.record("ignore", "add", [], wf_id)
+        if answer in ["ignore", "skip"]:
+            return ""
+        self.record("cache", "add", [wf_id], answer)
+        self.record("annotated", "set", [rec[ID_KEY], i, wf_id], answer)
+        return answer
+
     def cache_suggestion(self, value):
-        if value in self.cache:
-            return favorite(self.cache[value])
-        return ""
+        return self.cache.favorite(value)
 
     def is_target(self, s):
         if s in self.ignore:
@@ -165,45 +369,28 @@ class WordAnnotator(CliAnnotator):
         return res
 
     def parse(self, rec):
-        self.annotated.setdefault(rec[ID_KEY], {})
+        annotated = self.annotated.get(rec[ID_KEY], {})
+        provisional = self.provisional.get(rec[ID_KEY], {})
+        wf_ids = self.word_ids(rec)
         rec[self.output_col] = ["" for x in range(0, len(rec[self.parse_col]))]
-        for i, values in enumerate(zip(*rec.values())):
-            wf_id = self.identify(values)
+        for i, wf_id in enumerate(wf_ids):
             if wf_id in self.ignore:
                 rec[self.output_col][i] = ""
                 continue
             retrieved = False
-            if i in self.annotated[rec[ID_KEY]]:
-                if wf_id in self.annotated[rec[ID_KEY]][i]:
-                    print(f"oh hello i just found {wf_id} in my annotations!")
-                    answer = self.annotated[rec[ID_KEY]][i][wf_id]
+            for source in [annotated, provisional]:
+                if wf_id in source.get(i, {}):
+                    answer = source[i][wf_id]
                     rec[self.output_col][i] = answer
                     retrieved = True
                     if self.fix:
-                        answer = self.prompt_at_position(
-                            rec, i, prompt=f"Annotate?", pre_fill=answer
+                        rec[self.output_col][i] = self.ask(
+                            rec, i, wf_id, pre_fill=answer
                         )
-            if not retrieved:
+                    break
+            if not retrieved and not self.batch:  # queued items were asked for
                 if self.is_target(wf_id):
-                    answer = self.prompt_at_position(
-                        rec,
-                        i,
-                        prompt=f"Annotate?",
-                        pre_fill=self.find_suggestion(wf_id, rec),
-                    )
-                    if answer == "ignore":  # annotate nothing and never ask again
-                        self.ignore.add(wf_id)
-                    if answer not in ["ignore", "skip"]:
-                        self.cache.setdefault(wf_id, [])
-                        self.cache[wf_id].append(answer)
-                        self.annotated[rec[ID_KEY]][i].setdefault({})
-                        self.annotated[rec[ID_KEY]][i][wf_id] = answer
-                        rec[self.output_col][i] = answer
-                    else:
-                        rec[self.output_col][i] = ""
-        dump(self.annotated, self.annotated_path)  # keep updates
-        dump(self.cache, self.cache_path)  # keep updates
-        dump(list(self.ignore), self.ignore_path)  # keep updates
+                    rec[self.output_col][i] = self.ask(rec, i, wf_id)
         return rec
 
 
@@ -212,101 +399,111 @@ class GraidAnnotator(WordAnnotator):
 
 
 class RefINDAnnotator(WordAnnotator):
-    ref_count = {}
-
-    files = {"entities": {}, "cache": {}}
+    files = {"entities": {}, "cache": {}, "provisional": {}}
 
     def __init__(
         self,
         name: str = "refind",
         graid_key: str = "graid",
         output_col: str = "refind",
+        interactive: bool = True,
+        batch: bool = False,
         **kwargs,
     ):
         self.output_col = output_col
         self.name = name
+        self.interactive = interactive
+        self.batch = batch
         # self.entities_path = Path(f"{self.name}_entities.yaml")
         # self.entities = load(self.entities_path)
         # self.text_key = "txt"
         self.data_setup(**kwargs)
-        for k in self.entities.keys():
-            self.ref_count[k] = 0
-        self.ref_count[""] = 0
-        self.annotated_path = "refind.yaml"
+        self.cache = SuggestionIndex(self.cache)
+        self.ref_count = RankedCounter(
+            [ent for ents in self.entities.values() for ent in ents] + [""]
+        )
+        self.annotated_path = Path("refind.yaml")
         self.annotated = load(self.annotated_path)
+        for words in self.annotated.values():
+            for answers in words.values():
+                for ann, answer in answers.items():
+                    self.cache.add(ann, answer)
+        self.start_session("annotated", "entities", "provisional")
 
     def sort(self, entities, graid):
         if graid in self.cache:
-            sort_order = self.ref_count.copy()
-            # print(sort_order)
-            sort_order[favorite(self.cache[graid])] = 100000
-            sorted_entities = {}
-            for k, v in sorted(
-                entities.items(),
-                key=lambda val: sort_order.get(val[0], 0),
-                reverse=True,
-            ):
-                sorted_entities[k] = v
-            return sorted_entities
+            return {
+                k: entities[k]
+                for k in self.ref_count.ranked(
+                    entities, first=self.cache.favorite(graid)
+                )
+            }
         return entities
 
+    def batch_items(self, rec):
+        return [
+            (i, ann, None)
+            for i, p_annotation in enumerate(rec[GRAID_KEY])
+            for ann in p_annotation.split(" ")
+            if pygraid.is_referential(ann)
+        ]
+
+    def applicable(self, answer, rec):
+        """Referents are specific to texts."""
+        return answer == "" or answer in self.entities.get(rec[self.text_key], {})
+
+    def ask(self, rec, i, ann, candidates=None):
+        if rec[self.text_key] in self.entities:
+            sorted_entities = self.sort(self.entities[rec[self.text_key]], ann)
+        else:
+            sorted_entities = []
+            self.record("entities", "set", [rec[self.text_key]], {})
+        log.warning(sorted_entities)
+        print_record(rec, highlight_pos=i)
+        answer = choose_from_list(
+            list(sorted_entities) + ["new entity", "nonreferential"],
+            f"Identify referent in {ann} ({rec['obj'][i]} '{rec['gls'][i]}'):",
+        )
+        if answer == "new entity":
+            ent_name = input("Name?")
+            ent_id = humidify(ent_name, key="entities")
+            user_id = input(f"Abbreviation? (default: {ent_id})")
+            ent_id = user_id or ent_id  # f"{rec[self.text_key]}-{user_id or ent_id}"
+            self.record("entities", "set", [rec[self.text_key], ent_id], ent_name)
+            answer = ent_id
+        elif answer == "nonreferential":
+            answer = ""
+        self.record("annotated", "set", [rec[ID_KEY], i, ann], answer)
+        self.cache.add(ann, answer)
+        return answer
+
     def parse(self, rec):
         if GRAID_KEY not in rec:
             log.error(f"No field '{GRAID_KEY}'. Please add GRAID annotations first.")
             exit()
-        self.annotated.setdefault(rec[ID_KEY], {})
+        annotated = self.annotated.get(rec[ID_KEY], {})
+        provisional = self.provisional.get(rec[ID_KEY], {})
         rec[self.output_col] = []
         for i, p_annotation in enumerate(rec[GRAID_KEY]):
             answers = []
             for ann in p_annotation.split(" "):
                 if pygraid.is_referential(ann):
-                    retrieved = False
-                    if i in self.annotated[rec[ID_KEY]]:
-                        if ann in self.annotated[rec[ID_KEY]][i]:
-                            answer = self.annotated[rec[ID_KEY]][i][ann]
-                            retrieved = True
-                    if not retrieved:
-                        if rec[self.text_key] in self.entities:
-                            sorted_entities = self.sort(
-                                self.entities[rec[self.text_key]], ann
-                            )
-                        else:
-                            sorted_entities = []
-                            self.entities[rec[self.text_key]] = {}
-                        log.warning(sorted_entities)
-                        print_record(rec, highlight_pos=i)
-                        answer = choose_from_list(
-                            list(sorted_entities) + ["new entity", "nonreferential"],
-                            f"Identify referent in {ann} ({rec['obj'][i]} '{rec['gls'][i]}'):",
-                        )
-                        if answer == "new entity":
-                            ent_name = input("Name?")
-                            ent_id = humidify(ent_name, key="entities")
-                            user_id = input(f"Abbreviation? (default: {ent_id})")
-                            ent_id = (
-                                user_id or ent_id
-                            )  # f"{rec[self.text_key]}-{user_id or ent_id}"
-                            self.entities[rec[self.text_key]][ent_id] = ent_name
-                            answer = ent_id
-                        elif answer == "nonreferential":
-                            answer = ""
-                        self.annotated[rec[ID_KEY]].setdefault(i, {})
-                        self.annotated[rec[ID_KEY]][i][ann] = answer
-                        self.save()
+                    if ann in annotated.get(i, {}):
+                        answer = annotated[i][ann]
+                    elif ann in provisional.get(i, {}):
+                        answer = provisional[i][ann]
+                    elif self.batch:  # queued items were asked for
+                        answer = ""
                     else:
-                        self.annotated[rec[ID_KEY]].setdefault(i, {})
-                        self.annotated[rec[ID_KEY]][i][ann] = answer
+                        answer = self.ask(rec, i, ann)
                     answers.append(answer)
-                    self.cache.setdefault(ann, [])
-                    self.cache[ann].append(answer)
-                    self.ref_count.setdefault(answer, 0)
-                    self.ref_count[answer] += 1
+                    self.ref_count.add(answer)
             rec[self.output_col].append(" ".join(answers))
         return rec
 
 
 class UniParser(CliAnnotator):
-    files = {"annotated": {}, "cache": {}, "disambiguation": {}}
+    files = {"annotated": {}, "cache": {}, "disambiguation": {}, "provisional": {}}
 
     punctuation: ['"', ","]
 
@@ -316,15 +513,17 @@ class UniParser(CliAnnotator):
         handle_ambiguity=None,
         interactive=True,
         use_cache=False,
+        batch=False,
         **kwargs,
     ):
         self.name = name
         self.interactive = interactive
+        self.batch = batch
         self.handle_ambiguity = handle_ambiguity
         self.trans_key = kwargs.get("trans_key", "Translation")
         self.use_cache = use_cache
         if not use_cache:
-            del self.files["cache"]
+            self.files = {k: v for k, v in self.files.items() if k != "cache"}
         self.analyzer = kwargs.get("analyzer", ".")
         self.word_sep = kwargs.get("word_sep", " ")
         self.parse_col = kwargs.get(
@@ -338,31 +537,25 @@ class UniParser(CliAnnotator):
         self.data_setup(**kwargs)
         self.unparsable = []
         self.unparsable_path = Path(f"{self.name}_unparsable.txt")
-        self.frequency_counts = {}
-        for pos in self.annotated.values():
-            for form, gloss in pos.items():
-                self.step_freq_counter(form, gloss)
+        self.frequency_counts = SuggestionIndex()
+        for words in self.annotated.values():
+            for i, word in words.items():
+                if isinstance(word, list):  # [word form, gloss], before 0.1.4
+                    words[i] = word = {word[0]: word[1]}
+                for form, gloss in word.items():
+                    self.step_freq_counter(form, gloss)
+        self.analyses = {}
         self.disamb_path = kwargs.get("disamb_path", self.name + "_disamb.yaml")
         self.disamb_path = Path(self.disamb_path)
+        self.disamb_answers = {}
         if self.disamb_path.is_file():
             self.disamb_answers = load(self.disamb_path)
+        self.disamb_answers_path = self.disamb_path
         if not self.unparsable_path:
             self.unparsable_path = self.name + "_unparsable.txt"
-        if isinstance(
-            self.analyzer, str
-        ):  # initialize a uniparser analyser from a putative path
-            ana_path = Path(self.analyzer)
-            self.analyzer = Analyzer()
-            for att, filename in [
-                ("lexFile", "lexemes.txt"),
-                ("paradigmFile", "paradigms.txt"),
-                ("delAnaFile", "bad_analyses.txt"),
-                ("cliticFile", "clitics.txt"),
-            ]:
-                filepath = ana_path / filename
-                if filepath:
-                    setattr(self.analyzer, att, filepath)
-            self.analyzer.load_grammar()
+        if isinstance(self.analyzer, (str, Path)):  # a grammar directory
+            self.analyzer = get_analyzer(self.analyzer)
+        self.start_session("annotated", "disamb_answers", "provisional")
 
     def _get_field(self, wf, field):
         field_dic = {
@@ -402,22 +595,111 @@ class UniParser(CliAnnotator):
             "\n".join([f"{x}\t{y}" for x, y in unparsable_counts]), self.unparsable_path
         )
         # dump("\n\n".join(self.ambiguous), self.ambiguous_path)
-        if self.interactive:
-            dump(self.annotated, self.annotated_path)
+        self.session.close()
         if self.use_cache:
             dump(self.cache, self.cache_path)
-        if self.justify_choices:
-            dump(self.disamb_answers, self.disamb_path)
 
     def step_freq_counter(self, word_form, objgloss):
-        log.debug(f"stepping it up for {word_form}", objgloss)
-        self.frequency_counts.setdefault(word_form, [])
-        self.frequency_counts[word_form].append(objgloss)
+        log.debug(f"stepping it up for {word_form}: {objgloss}")
+        self.frequency_counts.add(word_form, objgloss)
 
     def get_freq_suggestion(self, word_form):
-        if word_form not in self.frequency_counts:
+        return self.frequency_counts.favorite(word_form, None)
+
+    def words(self, record):
+        return record[self.parse_col].strip(self.word_sep).split(self.word_sep)
+
+    def preannotate(self, records):
+        """Analyzes all distinct word forms at once before pre-annotating."""
+        forms = sorted({form for record in records for form in self.words(record)})
+        for form, wf_analysis in zip(forms, self.parse_word(forms)):
+            self.analyses[form] = [x.to_json() for x in wf_analysis]
+        super().preannotate(records)
+
+    def batch_items(self, record):
+        res = []
+        for i, form in enumerate(self.words(record)):
+            wf_analysis = self.analyses.get(form, [])
+            if len(wf_analysis) > 1:
+                res.append((i, form, tuple(x["gloss"] for x in wf_analysis)))
+        return res
+
+    def batch_suggestion(self, word_form, candidates):
+        return self.frequency_counts.confidence(word_form, candidates)
+
+    def ask(self, record, i, word_form, candidates):
+        gloss = self.choose(record, i, word_form)
+        if gloss is not None:
+            self.record("annotated", "set", [record[ID_KEY], i], {word_form: gloss})
+            self.step_freq_counter(word_form, gloss)
+        return gloss
+
+    def choose(self, record, i, word_form, suggestion=None):
+        """Prompts for one of the analyses of `word_form` at position `i`."""
+        wf_analysis = self.analyses[word_form]
+        suggestion = suggestion or self.get_freq_suggestion(word_form)
+        wf_analysis = sorted(wf_analysis, key=lambda x: x["gloss"] != suggestion)
+        print(
+            self.word_sep.join(highlight_list(self.words(record), i)),
+            f"‘{record.get(self.trans_key, '')}’",
+            sep="\n",
+        )
+        answers = [
+            f"({n+1}) "
+            + "\n       ".join(pad_ex([x["wfGlossed"]], [x["gloss"]], as_tuple=True))
+            for n, x in enumerate(wf_analysis)
+        ]
+        choice = questionary.select(
+            "", choices=answers + ["I'd rather not choose."]
+        ).ask()
+        if choice not in answers:
             return None
-        return favorite(self.frequency_counts[word_form])
+        return wf_analysis[answers.index(choice)]["gloss"]
+
+    def review(self, records):
+        """Asks for one analysis per ambiguous word form and set of candidates,
+        the most frequent first, and uses it for all occurrences, or asks
+        for every occurrence with that analysis as the default."""
+        queue = DisambiguationQueue()
+        for item in self.queue:
+            queue.add(
+                item["rec_id"],
+                item["idx"],
+                item["key"],
+                item["candidates"],
+                n=item["rec"],
+            )
+        for form, candidates, contexts in queue.ranked():
+            (rec_id, i), info = contexts[0]
+            gloss = self.confident(form, candidates, records[info["n"]])
+            if gloss is not None:
+                target = "provisional"
+            else:
+                target = "annotated"
+                print(f"{form}: {len(contexts)} occurrence(s)")
+                gloss = self.choose(records[info["n"]], i, form)
+                if gloss is None:
+                    continue
+            overrides = {}
+            if target == "annotated" and len(contexts) > 1:
+                if not questionary.confirm(
+                    f"Use '{gloss}' for all {len(contexts)} occurrences?"
+                ).ask():
+                    for (rec_id, i), info in contexts[1:]:
+                        overrides[(rec_id, i)] = self.choose(
+                            records[info["n"]], i, form, suggestion=gloss
+                        )
+            decisions = queue.resolve(form, candidates, gloss, overrides)
+            self.session.record_many(
+                [
+                    (target, "set", [rec_id, i], {form: choice})
+                    for rec_id, i, choice in decisions
+                ]
+            )
+            if target == "annotated":
+                for rec_id, i, choice in decisions:
+                    self.step_freq_counter(form, choice)
+        self.queue = []
 
     def parse(self, record):
         log.debug(f"""Parsing {record[self.parse_col]} ({record[ID_KEY]})""")
@@ -434,11 +716,13 @@ class UniParser(CliAnnotator):
         unparsable = []
         ambiguous = {}
         annotated_analyses = {}
-        parse_target = record[self.parse_col].strip(self.word_sep).split(self.word_sep)
+        parse_target = self.words(record)
         if not self.use_cache or not record[ID_KEY] in self.cache:
-            all_analyses = self.parse_word(parse_target)
-            print("ANALYSES", all_analyses)
-            all_analyses = [[x.to_json() for x in y] for y in all_analyses]
+            if all(x in self.analyses for x in parse_target):
+                all_analyses = [self.analyses[x] for x in parse_target]
+            else:
+                all_analyses = self.parse_word(parse_target)
+                all_analyses = [[x.to_json() for x in y] for y in all_analyses]
         if self.use_cache:
             if record[ID_KEY] in self.cache:
                 all_analyses = self.cache[record[ID_KEY]]
@@ -450,12 +734,15 @@ class UniParser(CliAnnotator):
                 found_past = False
                 word_form = wf_analysis[0]["wf"]
                 ambiguous[word_form] = []
+                chosen = None
+                for source in [self.annotated, self.provisional]:
+                    chosen = chosen or source.get(record[ID_KEY], {}).get(
+                        word_count, {}
+                    ).get(word_form)
                 for potential_analysis in wf_analysis:
                     ambiguous[word_form].append(str(potential_analysis))
-                    if record[ID_KEY] in self.annotated:
-                        if potential_analysis["gloss"] == self.annotated[
-                            record[ID_KEY]
-                        ].get(word_count, {word_form: None}).get(word_form):
+                    if chosen is not None:
+                        if potential_analysis["gloss"] == chosen:
                             log.debug(
                                 f"""Disambiguated: analysis {repr_wf(potential_analysis)} in {record[ID_KEY]}"""
                             )
@@ -464,40 +751,27 @@ class UniParser(CliAnnotator):
                             analysis = potential_analysis
                             found_past = True
                 if not found_past:
-                    if self.interactive:
-                        obj_choices = []
-                        gloss_choices = []
+                    if self.interactive and not self.batch:
                         suggestion = self.get_freq_suggestion(word_form)
                         reordered_analyses = []
                         best_guess = None
                         for cand_ana in wf_analysis:
-                            if (
-                                f"{cand_ana['wfGlossed']}:{cand_ana['gloss']}"
-                                == suggestion
-                            ):
+                            if cand_ana["gloss"] == suggestion:
                                 best_guess = cand_ana
                             else:
                                 reordered_analyses.append(cand_ana)
 
                         if best_guess:
                             reordered_analyses = [best_guess] + reordered_analyses
-                        for analysis in reordered_analyses:
-                            potential_obj = added_fields["wfGlossed"] + [
-                                analysis["wfGlossed"]
-                            ]
-                            potential_gloss = added_fields["gloss"] + [
-                                analysis["gloss"]
-                            ]
-                            obj_choices.append(potential_obj)
-                            gloss_choices.append(potential_gloss)
+                        # the words so far are laid out once for all candidates
+                        layout = InterlinearLayout(
+                            added_fields["wfGlossed"], added_fields["gloss"]
+                        )
                         answers = []
-                        for i, (obj, gloss) in enumerate(
-                            zip(
-                                obj_choices,
-                                gloss_choices,
+                        for i, analysis in enumerate(reordered_analyses):
+                            pad_obj, pad_gloss = layout.preview(
+                                analysis["wfGlossed"], analysis["gloss"]
                             )
-                        ):
-                            pad_obj, pad_gloss = pad_ex(obj, gloss, as_tuple=True)
                             answers.append(
                                 f"({i+1}) " + pad_obj + "\n       " + pad_gloss
                             )
@@ -515,14 +789,12 @@ class UniParser(CliAnnotator):
                             choices=answers,
                         ).ask()
                         if choice == "I'd rather not choose.":
-                            analysis = Wordform(self.analyzer.g).to_json()
-                            analysis["wf"] = reordered_analyses[0]["wf"]
+                            analysis = empty_analysis(reordered_analyses[0]["wf"])
                         else:
                             analysis = reordered_analyses[andic[choice]]
-                            annotated_analyses[word_count] = [
-                                word_form,
-                                analysis["gloss"],
-                            ]
+                            annotated_analyses[word_count] = {
+                                word_form: analysis["gloss"]
+                            }
                             self.step_freq_counter(word_form, analysis["gloss"])
                             if self.justify_choices:
                                 # print("you chose", analysis)
@@ -530,23 +802,24 @@ class UniParser(CliAnnotator):
                                 # print("at position", word_count)
                                 # print("instead of", wf_analysis)
                                 motivation = questionary.text("Why?").ask()
-                                self.disamb_answers.setdefault(analysis["wf"], {})
-                                self.disamb_answers[analysis["wf"]][
-                                    f"{record[ID_KEY]}-{word_count}"
-                                ] = {
-                                    "choice": analysis,
-                                    "alternatives": [
-                                        ana
-                                        for ana in reordered_analyses
-                                        if ana["gloss"] != analysis["gloss"]
-                                    ],
-                                    "motivation": motivation,
-                                }
+                                self.record(
+                                    "disamb_answers",
+                                    "set",
+                                    [analysis["wf"], f"{record[ID_KEY]}-{word_count}"],
+                                    {
+                                        "choice": analysis,
+                                        "alternatives": [
+                                            ana
+                                            for ana in reordered_analyses
+                                            if ana["gloss"] != analysis["gloss"]
+                                        ],
+                                        "motivation": motivation,
+                                    },
+                                )
                     elif self.handle_ambiguity is None:
                         only_polysemy = self._compare_ids(wf_analysis)
-                        analysis = Wordform(self.analyzer.g).to_json()
+                        analysis = empty_analysis(wf_analysis[0]["wf"])
                         analysis["id"] = ""
-                        analysis["wf"] = wf_analysis[0]["wf"]
                         for field_name in self.uniparser_fields:
                             analysis[field_name] = "?"
                         if only_polysemy:
@@ -650,10 +923,6 @@ class UniParser(CliAnnotator):
         for field_name, output_col in self.uniparser_fields.items():
             record[output_col] = added_fields[field_name]
         if self.interactive and annotated_analyses:
-            self.annotated.setdefault(record[ID_KEY], {})
             for i, data in annotated_analyses.items():
-                self.annotated[record[ID_KEY]][i] = data
-            dump(self.annotated, self.annotated_path)
-            if self.justify_choices:
-                dump(self.disamb_answers, self.disamb_path)
+                self.record("annotated", "set", [record[ID_KEY], i], data)
         return record
@@ -1,6 +1,7 @@
 import logging
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
 from parsimonious.exceptions import ParseError
 from parsimonious.grammar import Grammar
@@ -34,61 +35,55 @@ class AttrValue:
 
 @dataclass
 class BaseExpression:
-    def match(self, dict):
+    matcher = None
+
+    def compile(self):
+        """Builds (once) a function matching word dicts against the expression."""
+        if self.matcher is None:
+            self.matcher = self._compile()
+        return self.matcher
+
+    def _compile(self):
         log.warning("UNIMPLEMENTED MATCH FUNCTION")
-        return False
+        return lambda dic: False
+
+    def match(self, dic):
+        return self.compile()(dic)
 
 
 @dataclass
 class Expression(BaseExpression):
     attr_val: AttrValue = None
 
-    def match(self, dic):
-        def _match(pattern, value, regex=True, pos=True):
+    def _compile(self):
+        if not self.attr_val:
+            return lambda dic: True
+        attr, comparator, val = (
+            self.attr_val.attr,
+            self.attr_val.comparator,
+            self.attr_val.val,
+        )
+        if comparator in ["=", "!="]:
+            test = re.compile("^" + val.replace("*", ".*?") + "$").match
+        else:
+
+            def test(value):
+                return value == val
+
+        positive = comparator in ["=", "=="]
+
+        def matcher(dic):
+            value = dic.get(attr, "")
             if isinstance(value, list):
-                if pos:
-                    if regex:
-                        if any(pattern.match(value) for value in value):
-                            return True
-                    elif any(pattern == value for value in value):
-                        return True
-                else:
-                    if regex:
-                        if not any(pattern.match(value) for value in value):
-                            return True
-                    elif not any(pattern == value for value in value):
-                        return True
+                hit = any(test(x) for x in value)
             else:
-                if pos:
-                    if regex:
-                        if pattern.match(value):
-                            return True
-                    elif pattern == value:
-                        return True
-                else:
-                    if regex:
-                        if not pattern.match(value):
-                            return True
-                    elif pattern != value:
-                        return True
-            return False
+                hit = bool(test(value))
+            return hit == positive
 
-        if not self.attr_val:
-            return True
-        value = dic.get(self.attr_val.attr, "")
-        if self.attr_val.comparator == "=":
-            pattern = re.compile("^" + self.attr_val.val.replace("*", ".*?") + "$")
-            return _match(pattern, value)
-        if self.attr_val.comparator == "!=":
-            pattern = re.compile("^" + self.attr_val.val.replace("*", ".*?") + "$")
-            return _match(pattern, value, pos=False)
-        if self.attr_val.comparator == "==":
-            return _match(self.attr_val.val, value, regex=False)
-        if self.attr_val.comparator == "!==":
-            return _match(self.attr_val.val, value, pos=False, regex=False)
+        return matcher
 
     def __repr__(self):
-        return str(self.attr_val)
+        return str(self.attr_val) if self.attr_val else ""
 
 
 @dataclass
@@ -99,8 +94,9 @@ class GroupExpression(BaseExpression):
 
 @dataclass
 class And(GroupExpression):
-    def match(self, dict):
-        return self.a.match(dict) and self.b.match(dict)
+    def _compile(self):
+        a, b = self.a.compile(), self.b.compile()
+        return lambda dic: a(dic) and b(dic)
 
     def __repr__(self):
         return f"({self.a} & {self.b})"
@@ -108,8 +104,9 @@ class And(GroupExpression):
 
 @dataclass
 class Or(GroupExpression):
-    def match(self, dict):
-        return self.a.match(dict) or self.b.match(dict)
+    def _compile(self):
+        a, b = self.a.compile(), self.b.compile()
+        return lambda dic: a(dic) or b(dic)
 
     def __repr__(self):
         return f"({self.a} | {self.b})"
@@ -118,12 +115,115 @@ class Or(GroupExpression):
 @dataclass
 class Token:
     expr: BaseExpression
+    min: int = 1
+    max: int = 1  # None: unbounded
+
+    def compile(self):
+        return self.expr.compile()
 
-    def match(self, dict):
-        return self.expr.match(dict)
+    def match(self, dic):
+        return self.expr.match(dic)
+
+    def quantifier(self):
+        if (self.min, self.max) == (1, 1):
+            return ""
+        if self.max is None:
+            return {0: "*", 1: "+"}.get(self.min, f"{{{self.min},}}")
+        if (self.min, self.max) == (0, 1):
+            return "?"
+        if self.min == self.max:
+            return f"{{{self.min}}}"
+        return f"{{{self.min},{self.max}}}"
 
     def __repr__(self):
-        return f"[{self.expr}]"
+        return f"[{self.expr}]{self.quantifier()}"
+
+
+class Query(list):
+    """A sequence of (quantified) tokens, optionally restricted to matches
+    spanning at most `within` words.
+
+    The tokens are compiled into a nondeterministic automaton which is run
+    over the words of a record in a single pass, keeping track of where each
+    partial match started.  All matches are found, including overlapping ones;
+    for every start position, the longest match is returned.
+    """
+
+    def __init__(self, tokens, within=None):
+        super().__init__(tokens)
+        self.within = within
+        self.steps = []  # (token, kind): kind is "one", "opt" or "star"
+        for token in tokens:
+            self.steps.extend([(token, "one")] * token.min)
+            if token.max is None:
+                self.steps.append((token, "star"))
+            else:
+                self.steps.extend([(token, "opt")] * (token.max - token.min))
+        self.accept = len(self.steps)
+        self.closures = [self._closure(p) for p in range(self.accept + 1)]
+        self.transitions = [
+            self.closures[p] if kind == "star" else self.closures[p + 1]
+            for p, (token, kind) in enumerate(self.steps)
+        ]
+        self.matchers = [token.compile() for token, kind in self.steps]
+        self.fixed = all(kind == "one" for token, kind in self.steps)
+
+    def _closure(self, p):
+        """States reachable from `p` by skipping optional steps."""
+        states = [p]
+        while p < self.accept and self.steps[p][1] != "one":
+            p += 1
+            states.append(p)
+        return tuple(states)
+
+    def finditer(self, words):
+        """Yields (start, end) word indices (inclusive) of all matches."""
+        if self.fixed:
+            yield from self._finditer_fixed(words)
+            return
+        ends = {}
+        active = {}  # state: starts of the partial matches in that state
+        for i, word in enumerate(words):
+            for p in self.closures[0]:
+                active.setdefault(p, set()).add(i)
+            hits = {}
+            advanced = {}
+            for p, starts in active.items():
+                if p == self.accept:
+                    continue
+                if self.within:
+                    starts = {x for x in starts if i - x < self.within}
+                    if not starts:
+                        continue
+                matcher = self.matchers[p]
+                if matcher not in hits:
+                    hits[matcher] = matcher(word)
+                if hits[matcher]:
+                    for q in self.transitions[p]:
+                        advanced.setdefault(q, set()).update(starts)
+            for start in advanced.get(self.accept, []):
+                ends[start] = i
+            active = advanced
+        yield from sorted(ends.items())
+
+    def _finditer_fixed(self, words):
+        """Matching without quantifiers: every start is checked directly."""
+        length = len(self.matchers)
+        if self.within and length > self.within:
+            return
+        matchers = list(enumerate(self.matchers))
+        for start in range(len(words) - length + 1):
+            for k, matcher in matchers:
+                if not matcher(words[start + k]):
+                    break
+            else:
+                yield start, start + length - 1
+
+    def __repr__(self):
+        res = " ".join(str(x) for x in self)
+        if self.within:
+            res += f" within {self.within}"
+        return res
 
 
 class SCLVisitor(NodeVisitor):
@@ -132,7 +232,30 @@ class SCLVisitor(NodeVisitor):
     # tree = parse('[lemma = "ref*" & tag=="imp"] [ ] [lemma="kettle"]')
 
     def visit_query(self, node, v_c):
-        return v_c
+        tokens, within = v_c
+        return Query(tokens, within=within[0] if isinstance(within, list) else None)
+
+    def visit_token_item(self, node, v_c):
+        token, quantifier = v_c
+        if isinstance(quantifier, list):
+            token.min, token.max = quantifier[0]
+        return token
+
+    def visit_quantifier(self, node, v_c):
+        if node.text == "+":
+            return 1, None
+        if node.text == "*":
+            return 0, None
+        if node.text == "?":
+            return 0, 1
+        low, comma, high = node.text[1:-1].partition(",")
+        low = int(low or 0)
+        if not comma:
+            return low, low
+        return low, int(high) if high else None
+
+    def visit_within(self, node, v_c):
+        return int(node.text[len("within") :])
 
     def visit_token(self, node, v_c):
         expr = v_c[1]
@@ -188,7 +311,12 @@ def strip_comments(s):
 
 grammar = Grammar(
     strip_comments(
-        r"""query = token+
+        r"""query = token_item+ within?
+token_item = token quantifier?
+quantifier = repeat / "+" / "*" / "?"
+repeat = "{" number? ("," number?)? "}"
+within = "within" number
+number = ~"[0-9]+"
 token = token_open expression? token_close
 token_open  = "["
 token_close = "]"
@@ -213,14 +341,29 @@ not_equal_plain = "!=="
 )
 
 
-def parse(query_string):
-    query_string = query_string.replace("'", '"')
-    query_string = strip_whitespace(query_string)
+def normalize(query_string):
+    return strip_whitespace(query_string.replace("'", '"'))
+
+
+@lru_cache(maxsize=512)
+def compile_query(query_string):
+    """Parses a normalized query into a `Query` with compiled matchers, or None.
+    Results are cached, so repeated queries skip parsing entirely."""
     try:
         tree = grammar.parse(query_string)
-        visitor = SCLVisitor()
-        return visitor.visit(tree)
     except ParseError as e:
         log.warning(e)
+        return None
+    query = SCLVisitor().visit(tree)
+    if any(x.max is not None and x.max < x.min for x in query):
+        log.warning(f"Invalid repetition in '{query_string}'")
+        return None
+    return query
+
+
+def parse(query_string):
+    tokens = compile_query(normalize(query_string))
+    if tokens is None:
         log.warning(f"Invalid query: '{query_string}'")
         return None
+    return tokens
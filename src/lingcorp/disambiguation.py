@@ -0,0 +1,93 @@
+import pandas as pd
+
+
+class DisambiguationQueue:
+    """Unresolved ambiguities, grouped by word form and set of candidate
+    analyses.  A decision for a group can be applied to all of its contexts
+    (record ID and word position) at once, with overrides for single contexts.
+    Groups are ranked by their number of tokens, so the first decisions
+    resolve the largest share of the ambiguous tokens.
+    """
+
+    def __init__(self):
+        self.groups = {}  # (form, candidates): {(rec_id, pos): info}
+        self.contexts = {}  # (rec_id, pos): (form, candidates)
+        self.records = {}  # rec_id: {pos}
+
+    @staticmethod
+    def group_key(form, candidates):
+        return form, tuple(sorted(set(candidates)))
+
+    def add(self, rec_id, pos, form, candidates, **info):
+        """Queues the word at `pos` in `rec_id`; `info` is kept for display."""
+        self.discard(rec_id, pos)
+        key = self.group_key(form, candidates)
+        self.groups.setdefault(key, {})[(rec_id, pos)] = info
+        self.contexts[(rec_id, pos)] = key
+        self.records.setdefault(rec_id, set()).add(pos)
+
+    def discard(self, rec_id, pos):
+        key = self.contexts.pop((rec_id, pos), None)
+        if key is None:
+            return
+        group = self.groups[key]
+        del group[(rec_id, pos)]
+        if not group:
+            del self.groups[key]
+        self.records[rec_id].discard(pos)
+        if not self.records[rec_id]:
+            del self.records[rec_id]
+
+    def discard_record(self, rec_id):
+        for pos in list(self.records.get(rec_id, [])):
+            self.discard(rec_id, pos)
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def ranked(self):
+        """`(form, candidates, contexts)` for all groups, most tokens first;
+        `contexts` is a list of `((rec_id, pos), info)`."""
+        groups = [
+            (form, candidates, list(contexts.items()))
+            for (form, candidates), contexts in self.groups.items()
+        ]
+        return sorted(groups, key=lambda x: (-len(x[2]), x[0], x[1]))
+
+    def resolve(self, form, candidates, choice, overrides=None):
+        """Applies `choice` to all contexts of the group, or the analysis given
+        for a context in `overrides` (`{(rec_id, pos): choice}`; None leaves
+        the context unresolved).  Returns the decisions as `(rec_id, pos,
+        choice)` and removes them from the queue."""
+        key = self.group_key(form, candidates)
+        overrides = overrides or {}
+        decisions = []
+        for rec_id, pos in list(self.groups.get(key, {})):
+            gloss = overrides.get((rec_id, pos), choice)
+            if gloss is None:
+                continue
+            self.discard(rec_id, pos)
+            decisions.append((rec_id, pos, gloss))
+        return decisions
+
+    def to_frame(self, examples=5):
+        """One row per group, with the share of ambiguous tokens it covers and
+        the cumulative share covered by the groups up to it."""
+        rows = [
+            {
+                "form": form,
+                "candidates": "; ".join(candidates),
+                "tokens": len(contexts),
+                "records": len({rec_id for (rec_id, pos), info in contexts}),
+                "examples": " ".join(
+                    f"{rec_id}:{pos}" for (rec_id, pos), info in contexts[:examples]
+                ),
+            }
+            for form, candidates, contexts in self.ranked()
+        ]
+        res = pd.DataFrame(
+            rows, columns=["form", "candidates", "tokens", "records", "examples"]
+        )
+        res.insert(3, "share", res["tokens"] / max(len(self), 1))
+        res.insert(4, "cumulative", res["share"].cumsum())
+        return res
@@ -0,0 +1,148 @@
+import csv
+import logging
+import math
+import os
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+FORMATS = {".csv": "csv", ".tsv": "tsv", ".parquet": "parquet"}
+
+# read once at import; os.umask can only be read by setting it, which is not
+# safe to do while other threads create files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def flatten(value):
+    """Joins a list of word-level values into a tab-separated string.
+    Empty slots (None) are dropped, nested lists are joined with commas."""
+    return "\t".join(
+        ",".join(x) if isinstance(x, list) else x for x in value if x is not None
+    )
+
+
+def _cell(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value
+
+
+class Exporter:
+    """Writes a DataFrame of (annotated) records to a CSV, TSV or parquet file.
+
+    Records are processed in chunks, without copying the frame.  The target
+    file is only replaced once everything has been written.  Progress can be
+    read from another thread while `write` is running.
+    """
+
+    def __init__(
+        self,
+        path,
+        fmt=None,
+        list_cols=None,
+        drop=None,
+        labels=None,
+        chunksize=1000,
+        lock=None,
+    ):
+        self.path = Path(path)
+        self.fmt = fmt or FORMATS.get(self.path.suffix, "csv")
+        if self.fmt not in FORMATS.values():
+            raise ValueError(f"Unknown export format '{self.fmt}'")
+        self.list_cols = list_cols or []
+        self.drop = drop or []
+        self.labels = labels or {}
+        self.chunksize = chunksize
+        self.lock = lock or nullcontext()
+        self.status = "pending"
+        self.written = 0
+        self.total = 0
+        self.error = None
+        self.finished = None  # time.monotonic() when done or failed
+
+    def progress(self):
+        return {
+            "status": self.status,
+            "written": self.written,
+            "total": self.total,
+            "path": str(self.path),
+            "error": self.error,
+        }
+
+    def chunks(self, data):
+        """Yields the header, then lists of rows ready to be written."""
+        columns = [x for x in data.columns if x not in self.drop]
+        list_idx = [i for i, col in enumerate(columns) if col in self.list_cols]
+        yield [self.labels.get(col, col) for col in columns]
+        for start in range(0, len(data), self.chunksize):
+            rows = []
+            with self.lock:
+                chunk = data.iloc[start : start + self.chunksize][columns]
+                for row in chunk.itertuples(index=False, name=None):
+                    row = list(row)
+                    for i in list_idx:
+                        if isinstance(row[i], list):
+                            row[i] = flatten(row[i])
+                    rows.append([_cell(x) for x in row])
+            yield rows
+
+    def write(self, data):
+        self.status = "running"
+        self.total = len(data)
+        self.written = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        os.close(fd)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)  # mkstemp files are owner-only
+        try:
+            if self.fmt == "parquet":
+                self._write_parquet(data, tmp_path)
+            else:
+                self._write_csv(data, tmp_path)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            Path(tmp_path).unlink(missing_ok=True)
+            self.status = "failed"
+            self.error = str(e)
+            self.finished = time.monotonic()
+            log.error(f"Export to {self.path} failed: {e}")
+            raise
+        self.status = "done"
+        self.finished = time.monotonic()
+        log.info(f"Exported {self.written} records to {self.path}")
+        return self.path
+
+    def _write_csv(self, data, tmp_path):
+        delimiter = "\t" if self.fmt == "tsv" else ","
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            chunks = self.chunks(data)
+            writer.writerow(next(chunks))
+            for rows in chunks:
+                writer.writerows(rows)
+                self.written += len(rows)
+
+    def _write_parquet(self, data, tmp_path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "Parquet export needs pyarrow: pip install lingcorp[parquet]"
+            ) from e
+
+        chunks = self.chunks(data)
+        schema = pa.schema([(col, pa.string()) for col in next(chunks)])
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for rows in chunks:
+                columns = [
+                    pa.array([str(x) for x in col], pa.string()) for col in zip(*rows)
+                ]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                self.written += len(rows)
@@ -0,0 +1,131 @@
+import hashlib
+import re
+from pathlib import Path
+
+from writio import load
+
+GRAMMAR_FILES = {
+    "lexFile": "lexemes.txt",
+    "paradigmFile": "paradigms.txt",
+    "delAnaFile": "bad_analyses.txt",
+    "cliticFile": "clitics.txt",
+}
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _blocks(text, marker):
+    """Splits a uniparser grammar file into the blocks starting with `marker`."""
+    blocks = []
+    for line in text.splitlines():
+        if line.startswith(marker):
+            blocks.append([line])
+        elif blocks and line.strip():
+            blocks[-1].append(line.rstrip())
+    return blocks
+
+
+def _stems(value):
+    """The strings of the stem variants in a `stem` field (`po.|pu.`)."""
+    return [re.sub(r"[.\[\]<>/]", "", x.strip()) for x in value.split("|")]
+
+
+class GrammarSnapshot:
+    """Hashes of the lexemes (by `lex`) and paradigms (by name) of a uniparser
+    grammar, with the stems and paradigms of every lexeme, to tell which word
+    forms a change to the grammar can affect."""
+
+    def __init__(self, lexemes=None, paradigms=None, other=""):
+        self.lexemes = lexemes or {}  # lex: {"hash", "stems", "paradigms"}
+        self.paradigms = paradigms or {}  # name: hash
+        self.other = other  # hash of the other grammar files
+
+    @classmethod
+    def read(cls, path):
+        path = Path(path)
+        files = {
+            name: (path / name).read_text(encoding="utf-8")
+            if (path / name).is_file()
+            else ""
+            for name in GRAMMAR_FILES.values()
+        }
+        lexemes = {}
+        for block in _blocks(files["lexemes.txt"], "-lexeme"):
+            fields = [line.strip().split(":", 1) for line in block[1:] if ":" in line]
+            fields = [(k.strip(), v.strip()) for k, v in fields]
+            lex = next((v for k, v in fields if k == "lex"), "")
+            entry = lexemes.setdefault(lex, {"hash": "", "stems": [], "paradigms": []})
+            entry["hash"] = _hash(entry["hash"] + "\n".join(block))
+            for key, value in fields:
+                if key == "stem":
+                    entry["stems"].extend(_stems(value))
+                elif key == "paradigm":
+                    entry["paradigms"].append(value)
+        paradigms = {}
+        for block in _blocks(files["paradigms.txt"], "-paradigm:"):
+            name = block[0].split(":", 1)[1].strip()
+            paradigms[name] = _hash(paradigms.get(name, "") + "\n".join(block))
+        other = _hash(
+            "\n".join(
+                text
+                for name, text in files.items()
+                if name not in ["lexemes.txt", "paradigms.txt"]
+            )
+        )
+        return cls(lexemes, paradigms, other)
+
+    @classmethod
+    def from_file(cls, path):
+        data = load(path)
+        return cls(data["lexemes"], data["paradigms"], data["other"])
+
+    def to_data(self):
+        return {
+            "lexemes": self.lexemes,
+            "paradigms": self.paradigms,
+            "other": self.other,
+        }
+
+    def affected_forms(self, old, forms):
+        """The word forms in `forms` (`{form: lemmas of its analyses}`) whose
+        analyses may differ between the `old` grammar and this one: those
+        analyzed as a changed lexeme or as a lexeme with a changed paradigm,
+        and those containing one of the stems of such lexemes.  None if
+        every form may be affected."""
+        if self.other != old.other:
+            return None
+        changed = {
+            lex
+            for lex in set(self.lexemes) | set(old.lexemes)
+            if self.lexemes.get(lex, {}).get("hash")
+            != old.lexemes.get(lex, {}).get("hash")
+        }
+        paradigms = {
+            name
+            for name in set(self.paradigms) | set(old.paradigms)
+            if self.paradigms.get(name) != old.paradigms.get(name)
+        }
+        for snapshot in [self, old]:
+            for lex, entry in snapshot.lexemes.items():
+                if set(entry["paradigms"]) & paradigms:
+                    changed.add(lex)
+        stems = {
+            stem
+            for snapshot in [self, old]
+            for lex in changed
+            for stem in snapshot.lexemes.get(lex, {}).get("stems", [])
+        }
+        if "" in stems:
+            return None
+        pattern = None
+        if stems:
+            pattern = re.compile(
+                "|".join(re.escape(x) for x in sorted(stems, key=len, reverse=True))
+            )
+        return {
+            form
+            for form, lemmas in forms.items()
+            if set(lemmas) & changed or (pattern and pattern.search(form))
+        }
@@ -1,6 +1,9 @@
 import logging
 import re
 from collections import Counter
+from contextlib import nullcontext
+from functools import lru_cache
+from types import MappingProxyType
 
 import pandas as pd
 import pygraid
@@ -11,6 +14,7 @@ from tqdm import tqdm
 from writio import load
 
 from lingcorp.config import INPUT_DIR
+from lingcorp.interlinear import InterlinearLayout, get_layout
 
 SEC_JOIN = ","
 SEP = "\t"
@@ -177,21 +181,64 @@ def load_annotations(key, field, data, rec_id=None):
     return data, field_annotations
 
 
-def run_pipeline(data, annotations, pipeline, pos_list):
+def profile_stage(profiler, name, records=0, item=None):
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, records=records, item=item)
+
+
+def records_to_frame(records):
+    data = pd.DataFrame.from_dict(records)
+    data.index = data["ID"]
+    return data
+
+
+def run_pipeline(data, annotations, pipeline, pos_list, profiler=None):
+    """Runs the pipeline items on the data. Pass a
+    `lingcorp.profiling.PipelineProfiler` to time the individual stages.
+
+    Consecutive annotators pass records on as dicts; a DataFrame is only built
+    when an annotation field is loaded and at the end."""
+    records = None
     for item in pipeline:
         if isinstance(item, dict):
-            data, field_annotations = load_annotations(item["key"], item, data)
+            if records is not None:
+                with profile_stage(profiler, "to_frame", len(records)):
+                    data = records_to_frame(records)
+                records = None
+            with profile_stage(profiler, f"load_annotations:{item['key']}", len(data)):
+                data, field_annotations = load_annotations(item["key"], item, data)
             annotations[item["key"]] = field_annotations
         else:
-            res = []
-            for x in tqdm(data.to_dict("records")):
-                res.append(item.parse(x))
-            item.save()
-            data = pd.DataFrame.from_dict(res)
-            data.index = data["ID"]
-    if "grm" in data.columns and "pos" not in data.columns:
-        data = data.apply(lambda x: insert_pos_rec(x, pos_list=pos_list), axis=1)
-        data = data.apply(lambda x: add_wid(x), axis=1)
+            name = f"{type(item).__name__}:{getattr(item, 'name', '')}"
+            if records is None:
+                with profile_stage(profiler, "to_records", len(data)):
+                    records = data.to_dict("records")
+            if getattr(item, "batch", False):
+                with profile_stage(profiler, f"{name} preannotate", len(records)):
+                    item.preannotate(records)
+            with profile_stage(profiler, name, len(records), item=item):
+                if hasattr(item, "parse_records"):  # annotates whole columns
+                    records = item.parse_records(records)
+                else:
+                    records = [item.parse(x) for x in tqdm(records)]
+            with profile_stage(profiler, f"{name} save"):
+                item.save()
+    if records is None:
+        columns = data.columns
+    else:
+        columns = records[0].keys() if records else []
+    if "grm" in columns and "pos" not in columns:
+        if records is None:
+            with profile_stage(profiler, "to_records", len(data)):
+                records = data.to_dict("records")
+        with profile_stage(profiler, "insert_pos_rec", len(records)):
+            records = [insert_pos_rec(x, pos_list=pos_list) for x in records]
+        with profile_stage(profiler, "add_wid", len(records)):
+            records = [add_wid(x) for x in records]
+    if records is not None:
+        with profile_stage(profiler, "to_frame", len(records)):
+            data = records_to_frame(records)
     return data
 
 
@@ -222,27 +269,15 @@ def listify(x):
     return [x]
 
 
+def _cell(x):
+    return SEC_JOIN.join(x) if isinstance(x, list) else x
+
+
 def pad_ex(*lines, sep=" ", as_tuple=False):
-    out = {}
-    lines = [
-        [",".join(x) if x and isinstance(x[0], list) else x for x in line]
-        for line in lines
-    ]
-    for glossbundle in zip(*lines):
-        glossbundle = list(
-            SEC_JOIN.join(x) if isinstance(x, list) else x for x in glossbundle
-        )
-        longest = len(max(glossbundle, key=len))
-        for i, obj in enumerate(glossbundle):
-            diff = longest - len(obj)
-            out.setdefault(i, [])
-            out[i].append(obj + " " * diff)
-    for k in out.copy():
-        out[k] = sep.join(out[k])
+    layout = InterlinearLayout(*[[_cell(x) for x in line] for line in lines], sep=sep)
     if as_tuple:
-        return tuple(out.values())
-    else:
-        return "\n".join(out.values())
+        return tuple(layout.lines())
+    return layout.render()
 
 
 class bcolors:
@@ -280,21 +315,8 @@ def human_sort(text):
 
 def print_record(rec, translation=True, highlight_pos=None):
     print_vals = ["srf", "obj", "gls", "pos", "grm", "graid"]
-    val_list = [y for x, y in rec.items() if x in print_vals]
-    if highlight_pos is not None:
-        highlighted = []
-        for l in val_list:
-            templist = []
-            for i, item in enumerate(l):
-                if isinstance(item, list):
-                    item = SEC_JOIN.join(item)
-                if i == highlight_pos:
-                    item = highlight(item)
-                templist.append(item)
-            highlighted.append(templist)
-        print(pad_ex(*highlighted))
-    else:
-        print(pad_ex(*val_list))
+    lines = tuple(tuple(_cell(x) for x in y) for x, y in rec.items() if x in print_vals)
+    print(get_layout(lines).render(highlight_pos, mark=highlight))
     if translation:
         print("‘" + rec["ftr"] + "’")
 
@@ -354,6 +376,32 @@ def get_morph_id(id_list, id_dic, obj, gloss="", mode="morphs"):
     return None
 
 
+class MorphIndex:
+    """The reverse of an `id_dic` (see `get_morph_id`): maps <"form:gloss">
+    strings to the IDs containing them, so that looking up a morph does not
+    go through the IDs of the word one by one.  Build it once and pass it to
+    `sort_uniparser_ids` in place of `id_dic`."""
+
+    def __init__(self, id_dic):
+        self.ids = set(id_dic)
+        self.index = {}  # "form:gloss": {m_id: morph_id}
+        for m_id, morphs in id_dic.items():
+            for test_str, morph_id in morphs.items():
+                self.index.setdefault(test_str, {})[m_id] = morph_id
+
+    def get_morph_id(self, id_list, obj, gloss="", mode="morphs"):
+        """Same as `get_morph_id`."""
+        if mode not in ["morphs", "morphemes"]:
+            raise ValueError(f"Invalid mode '{mode}'")
+        candidates = self.index.get(f"{obj}:{gloss}".strip(":"), {})
+        for m_id in id_list:
+            if m_id not in self.ids:
+                raise ValueError(f"ID {m_id} not found in id_dic")
+            if m_id in candidates:
+                return candidates[m_id] if mode == "morphs" else m_id
+        return None
+
+
 def sort_uniparser_ids(id_list, obj, gloss, id_dic, mode="morphs"):
     """Used for sorting the unsorted ID annotations by`uniparser
     <https://uniparser-morph.readthedocs.io/en/latest/paradigms.html#morpheme-ids>`_.
@@ -361,6 +409,7 @@ def sort_uniparser_ids(id_list, obj, gloss, id_dic, mode="morphs"):
     well as an unordered list of IDs.
     This method uses a dictionary matching IDs to <"form:gloss"> strings to
     sort this ID list, based on the segmented object and glossing lines.
+    `id_dic` can also be a `MorphIndex` of that dictionary.
 
     """
     igt = IGT(phrase=obj, gloss=gloss)
@@ -368,9 +417,14 @@ def sort_uniparser_ids(id_list, obj, gloss, id_dic, mode="morphs"):
     for w in igt.glossed_words:
         for m in w.glossed_morphemes:
             try:
-                sorted_ids.append(
-                    get_morph_id(id_list, id_dic, m.morpheme, m.gloss, mode)
-                )
+                if isinstance(id_dic, MorphIndex):
+                    sorted_ids.append(
+                        id_dic.get_morph_id(id_list, m.morpheme, m.gloss, mode)
+                    )
+                else:
+                    sorted_ids.append(
+                        get_morph_id(id_list, id_dic, m.morpheme, m.gloss, mode)
+                    )
             except ValueError as e:
                 log.error(e)
                 log.error(id_list)
@@ -379,6 +433,26 @@ def sort_uniparser_ids(id_list, obj, gloss, id_dic, mode="morphs"):
     return sorted_ids
 
 
+def sort_uniparser_column(id_lists, objs, glosses, id_dic, mode="morphs"):
+    """`sort_uniparser_ids` for all words of a column (e.g. the `mid`, `obj`
+    and `gls` columns of a dataframe).  The `id_dic` is indexed once and
+    every distinct combination of object, gloss and IDs is sorted once.
+    ID lists can be given as space-separated strings, as uniparser returns
+    them."""
+    index = id_dic if isinstance(id_dic, MorphIndex) else MorphIndex(id_dic)
+    memo = {}
+    res = []
+    for id_list, obj, gloss in zip(id_lists, objs, glosses):
+        if isinstance(id_list, str):
+            id_list = id_list.split()
+        key = (obj, gloss, tuple(id_list))
+        if key not in memo:
+            memo[key] = sort_uniparser_ids(id_list, obj, gloss, index, mode)
+        res.append(list(memo[key]))
+    log.debug(f"Sorted {len(res)} ID lists ({len(memo)} distinct)")
+    return res
+
+
 def pprint_uniparser(wf):
     if not wf.wfGlossed:
         return f"err: {wf.wf}"
@@ -462,6 +536,35 @@ def render_annotation(ann, pos=None, empty="&nbsp;"):
     return empty
 
 
+def freeze(value):
+    """A read-only version of nested dicts and lists."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(x) for x in value)
+    return value
+
+
+def thaw(value):
+    """A mutable copy of a `freeze`d value, with dicts and lists again."""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(x) for x in value]
+    return value
+
+
+@lru_cache(maxsize=65536)
+def parse_graid_annotation(annotation):
+    """Memoized `pygraid.parse_annotation` (structured mode).
+
+    GRAID strings repeat heavily, so every distinct annotation is only parsed
+    once.  The result is shared and read-only; `thaw` it to get the dicts and
+    lists `pygraid` returns.
+    """
+    return freeze(pygraid.parse_annotation(annotation, mode="structured"))
+
+
 def render_graid(
     ex,
     aligned_fields,
@@ -493,7 +596,7 @@ def render_graid(
             if graid is None:
                 res = {"pre": [], "data": [], "post": []}
             else:
-                res = pygraid.parse_annotation(graid, mode="structured")
+                res = parse_graid_annotation(graid)
             for pre in res.get("pre", []):
                 for col in aligned_fields:
                     modified_lines[col].append(special_empty.get(col, empty))
@@ -0,0 +1,81 @@
+import unicodedata
+from functools import lru_cache
+from itertools import accumulate
+
+
+@lru_cache(maxsize=100000)
+def display_width(s):
+    """The number of terminal columns `s` takes up: combining and other
+    zero-width characters take none, East Asian wide characters two."""
+    width = 0
+    for char in s:
+        if unicodedata.combining(char) or unicodedata.category(char) in [
+            "Mn",
+            "Me",
+            "Cf",
+        ]:
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ["W", "F"] else 1
+    return width
+
+
+def pad(s, width):
+    return s + " " * (width - display_width(s))
+
+
+class InterlinearLayout:
+    """Aligned interlinear lines of string cells.
+
+    Column widths are computed once and the padded lines are cached, so the
+    layout can be rendered again with a different column highlighted, or
+    previewed with an extra column, without aligning the other columns anew.
+    """
+
+    def __init__(self, *lines, sep=" "):
+        self.sep = sep
+        self.columns = list(zip(*lines))
+        self.widths = [max(display_width(x) for x in column) for column in self.columns]
+        self.padded = [
+            [pad(x, width) for x in column]
+            for column, width in zip(self.columns, self.widths)
+        ]
+        self.joined = [
+            sep.join(column[i] for column in self.padded) for i in range(len(lines))
+        ]
+        # where the cells start in the joined lines
+        self.starts = [
+            [0]
+            + list(accumulate(len(column[i]) + len(sep) for column in self.padded[:-1]))
+            for i in range(len(lines))
+        ]
+
+    def lines(self, highlight_pos=None, mark=None):
+        """The aligned lines, with the cells at `highlight_pos` passed through
+        `mark` (after padding, so markup does not affect the alignment)."""
+        if highlight_pos is None or not 0 <= highlight_pos < len(self.padded):
+            return list(self.joined)
+        res = []
+        for line, starts, cell in zip(
+            self.joined, self.starts, self.padded[highlight_pos]
+        ):
+            start = starts[highlight_pos]
+            res.append(line[:start] + mark(cell) + line[start + len(cell) :])
+        return res
+
+    def preview(self, *cells):
+        """The lines with the column `cells` appended, leaving the layout as
+        it is (e.g. to show candidate analyses for the next word)."""
+        width = max(display_width(x) for x in cells)
+        return [
+            (line + self.sep if self.padded else "") + pad(x, width)
+            for line, x in zip(self.joined, cells)
+        ]
+
+    def render(self, highlight_pos=None, mark=None):
+        return "\n".join(self.lines(highlight_pos, mark))
+
+
+@lru_cache(maxsize=256)
+def get_layout(lines, sep=" "):
+    """A shared layout for `lines`, a tuple of tuples of strings."""
+    return InterlinearLayout(*lines, sep=sep)
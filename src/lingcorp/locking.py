@@ -0,0 +1,32 @@
+import threading
+from contextlib import contextmanager
+
+
+class RecordLocks:
+    """Hands out one reentrant lock per record ID.
+
+    Requests touching different records do not block each other, requests
+    touching the same record are serialized.  Several records can be locked
+    at once; they are always acquired in sorted order to avoid deadlocks.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    def get(self, rec_id):
+        with self._guard:
+            if rec_id not in self._locks:
+                self._locks[rec_id] = threading.RLock()
+            return self._locks[rec_id]
+
+    @contextmanager
+    def __call__(self, *rec_ids):
+        locks = [self.get(rec_id) for rec_id in sorted(set(rec_ids))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
@@ -0,0 +1,107 @@
+import logging
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from writio import dump
+
+log = logging.getLogger(__name__)
+
+
+def cache_stats(item):
+    """Cache counters of a pipeline item, if it keeps any."""
+    if hasattr(item, "cache_stats"):
+        return item.cache_stats()
+    return {}
+
+
+class PipelineProfiler:
+    """Records wall time, throughput, cache hit rates and peak memory
+    for every stage of a pipeline run.
+
+    Peak memory is measured with `tracemalloc`, which slows down execution;
+    pass `memory=False` to only time the stages.
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = []
+        self.started = datetime.now().isoformat(timespec="seconds")
+
+    @contextmanager
+    def stage(self, name, records=0, item=None):
+        before = cache_stats(item)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            start_mem = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stage = {
+                "stage": name,
+                "seconds": round(seconds, 6),
+                "records": records,
+                "records_per_second": round(records / seconds, 1)
+                if records and seconds
+                else None,
+            }
+            if self.memory:
+                stage["peak_memory_mb"] = round(
+                    (tracemalloc.get_traced_memory()[1] - start_mem) / 1024**2, 3
+                )
+            after = cache_stats(item)
+            for cache, counts in after.items():
+                hits = counts["hits"] - before.get(cache, {}).get("hits", 0)
+                misses = counts["misses"] - before.get(cache, {}).get("misses", 0)
+                stage.setdefault("caches", {})[cache] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4)
+                    if hits + misses
+                    else None,
+                }
+            self.stages.append(stage)
+
+    def stop(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def total(self):
+        return sum(stage["seconds"] for stage in self.stages)
+
+    def report(self):
+        lines = [f"{'stage':<32} {'seconds':>9} {'rec/s':>10} {'peak MB':>8}  caches"]
+        for stage in self.stages:
+            caches = ", ".join(
+                f"{name} {counts['hit_rate']:.1%}"
+                for name, counts in stage.get("caches", {}).items()
+                if counts["hit_rate"] is not None
+            )
+            rate = stage["records_per_second"]
+            peak = stage.get("peak_memory_mb")
+            lines.append(
+                f"{stage['stage'][:32]:<32} {stage['seconds']:>9.3f} "
+                f"{rate if rate is not None else '':>10} "
+                f"{peak if peak is not None else '':>8}  {caches}"
+            )
+        lines.append(f"{'total':<32} {self.total():>9.3f}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "python": platform.python_version(),
+            "total_seconds": round(self.total(), 6),
+            "stages": self.stages,
+        }
+
+    def dump(self, path):
+        dump(self.to_dict(), path)
+        log.info(f"Wrote pipeline profile to {path}")
@@ -1,14 +1,24 @@
 import logging
+import multiprocessing as mp
+import os
 import re
 import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from itertools import count
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pygraid
 from tqdm import tqdm
 from writio import dump, load
 
+from lingcorp import stats
 from lingcorp.cql import parse
+from lingcorp.helpers import parse_graid_annotation, thaw
 
 log = logging.getLogger(__name__)
 
@@ -44,6 +54,158 @@ def empty_object(ann):
     return False
 
 
+PARALLEL_THRESHOLD = 200000
+_shard_words = None
+
+
+def _value_key(value):
+    if isinstance(value, list):
+        return tuple(value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class SharedWords:
+    """Word items encoded column by column, to be shared between processes:
+    for every attribute, a vocabulary of its values and a row of value codes
+    in a memory-mapped array.  Processes reading the array share its pages
+    (rather than copying pickled or refcounted word dicts); they decode the
+    word dicts of the records they search themselves.  Attributes missing
+    from a word are decoded as "", as queries read them.
+    """
+
+    def __init__(self, attrs, vocabs, offsets, path):
+        self.attrs = attrs
+        self.vocabs = vocabs
+        self.offsets = offsets  # start of every record in the array
+        self.path = path
+        self._codes = None
+
+    @classmethod
+    def encode(cls, word_items, path):
+        flat = [word for words in word_items for word in words]
+        attrs = sorted({attr for word in flat for attr in word})
+        codes = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.int32, shape=(len(attrs), len(flat))
+        )
+        vocabs = []
+        for k, attr in enumerate(attrs):
+            lookup = {}
+            vocab = []
+            row = np.empty(len(flat), dtype=np.int32)
+            for pos, word in enumerate(flat):
+                value = word.get(attr, "")
+                key = _value_key(value)
+                code = lookup.get(key)
+                if code is None:
+                    code = lookup[key] = len(vocab)
+                    vocab.append(value)
+                row[pos] = code
+            codes[k] = row
+            vocabs.append(vocab)
+        codes.flush()
+        del codes
+        offsets = np.cumsum([0] + [len(words) for words in word_items]).tolist()
+        return cls(attrs, vocabs, offsets, path)
+
+    @property
+    def codes(self):
+        if self._codes is None:
+            self._codes = np.load(self.path, mmap_mode="r")
+        return self._codes
+
+    def close(self):
+        self._codes = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "_codes": None}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, rec_idx):
+        block = self.codes[:, self.offsets[rec_idx] : self.offsets[rec_idx + 1]]
+        return [
+            dict(zip(self.attrs, [vocab[c] for vocab, c in zip(self.vocabs, codes)]))
+            for codes in block.T.tolist()
+        ]
+
+
+def _init_shard(words):
+    global _shard_words
+    _shard_words = words
+
+
+def _scan(queries, word_items, first=0, last=None):
+    """Matches and search time of each query in `word_items[first:last]`."""
+    compiled = [parse(x) for x in queries]
+    spans = [[] for x in compiled]
+    seconds = [0.0 for x in compiled]
+    last = len(word_items) if last is None else last
+    for rec_idx in range(first, last):
+        words = word_items[rec_idx]
+        for i, tokens in enumerate(compiled):
+            start_time = time.perf_counter()
+            spans[i].extend(
+                (rec_idx, start, end) for start, end in tokens.finditer(words)
+            )
+            seconds[i] += time.perf_counter() - start_time
+    return list(zip(spans, seconds))
+
+
+def _scan_shard(args):
+    return _scan(args[0], _shard_words, args[1], args[2])
+
+
+def scan(queries, word_items, processes=None, threshold=PARALLEL_THRESHOLD):
+    """Finds the matches of (parseable) query strings in the word items of all
+    records.  Returns a list of (record index, start, end) spans in corpus
+    order and the search time for every query.
+
+    Corpora with at least `threshold` words are split into shards of records
+    scanned by a pool of processes, which share the word items encoded as
+    `SharedWords` in a temporary file.  The processes are forked if no other
+    threads are running; otherwise (e.g. in the server) a forked process
+    could inherit locks held by another thread, and they are started by a
+    fork server instead.
+    """
+    processes = processes or os.cpu_count() or 1
+    methods = mp.get_all_start_methods()
+    if processes < 2 or sum(len(x) for x in word_items) < threshold:
+        return _scan(queries, word_items)
+    if "fork" in methods and threading.active_count() == 1:
+        context = mp.get_context("fork")
+    else:
+        context = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+    size = -(-len(word_items) // (processes * 4))
+    shards = [
+        (queries, start, min(start + size, len(word_items)))
+        for start in range(0, len(word_items), size)
+    ]
+    log.info(
+        f"Searching {len(shards)} shards with {processes} processes ({context.get_start_method()})"
+    )
+    fd, path = tempfile.mkstemp(prefix="lingcorp-words-", suffix=".npy")
+    os.close(fd)
+    try:
+        words = SharedWords.encode(word_items, path)
+        with context.Pool(processes, _init_shard, (words,)) as pool:
+            shard_results = pool.map(_scan_shard, shards)
+        words.close()
+    finally:
+        os.unlink(path)
+    return [
+        (
+            [span for res in shard_results for span in res[i][0]],
+            sum(res[i][1] for res in shard_results),
+        )
+        for i in range(len(queries))
+    ]
+
+
 class CorpusFrame(pd.DataFrame):
     searchcol = "Object"
     annotated_cols = ["refind", "graid"]
@@ -63,6 +225,8 @@ class CorpusFrame(pd.DataFrame):
     ]
     other_cols = ["lng"]
     conc_dir = Path("concordances")
+    max_distance = 20
+    persistence_window = 10
 
     def __init__(
         self,
@@ -92,13 +256,7 @@ class CorpusFrame(pd.DataFrame):
             self.resolve_graid_p_word = resolve_graid_p_word
         if "graid" in data.columns:
             # print(data[["refind", "graid"]])
-            graid_data = pd.DataFrame.from_dict(
-                self.get_graid_recs(data.to_dict("records"))
-            ).fillna("")
-            graid_data = self.add_clause_ids(graid_data.to_dict("records"))
-            graid_data = self.get_information_status(graid_data)
-            graid_data = pd.DataFrame.from_dict(graid_data).fillna("")
-            self.graid = graid_data
+            self.graid = self.graid_table(data.to_dict("records"))
         if list_cols:
             for col in list_cols:
                 if col in data.columns:
@@ -115,21 +273,58 @@ class CorpusFrame(pd.DataFrame):
             sys.exit()
         return df
 
-    def get_information_status(self, rec_list):
-        # topic persistence: how many reps in next 10 clauses?
-        # referential distance: how many clauses since last mention?
-        # come up with better informatoin status
-        res = []
-        found = []
-        for rec in rec_list:
-            if "refind" in rec and rec["refind"]:
-                if rec["refind"] not in found:
-                    found.append(rec["refind"])
-                    rec["info"] = "new"
-                else:
-                    rec["info"] = "old"
-            res.append(rec)
-        return res
+    def get_information_status(self, graid_data):
+        """Marks every mention of a referent (a `refind` value) as new or old
+        and adds Givón's text-based topicality measures:
+
+        * `ref_distance`: clauses since the last mention of the referent in
+          the same text, `max_distance` for first mentions (and capped there)
+        * `topic_persistence`: mentions in the `persistence_window` following
+          clauses of the same text
+
+        Both are computed in one pass in each direction, tracking the last
+        (respectively next) mentions of each referent in a hash map.
+        """
+        mentions = np.flatnonzero((graid_data["refind"] != "").to_numpy())
+        texts = (
+            graid_data["txt"].to_numpy()[mentions]
+            if "txt" in graid_data.columns
+            else [None] * len(mentions)
+        )
+        keys = list(zip(texts, graid_data["refind"].to_numpy()[mentions]))
+        clauses = graid_data["clause"].to_numpy()[mentions]
+        info, distance, persistence = [], [], [0] * len(mentions)
+        found = set()
+        last_mention = {}
+        for key, clause in zip(keys, clauses):
+            info.append("old" if key[1] in found else "new")
+            found.add(key[1])
+            if key in last_mention:
+                distance.append(min(clause - last_mention[key], self.max_distance))
+            else:
+                distance.append(self.max_distance)
+            last_mention[key] = clause
+        next_mentions = {}  # later mentions per referent, most distant first
+        for i in reversed(range(len(mentions))):
+            later = next_mentions.setdefault(keys[i], deque())
+            while later and later[0] > clauses[i] + self.persistence_window:
+                later.popleft()
+            same_clause = 0
+            while same_clause < len(later) and later[-1 - same_clause] == clauses[i]:
+                same_clause += 1
+            persistence[i] = len(later) - same_clause
+            later.append(clauses[i])
+        for col, values, dtype in [
+            ("info", info, object),
+            ("ref_distance", distance, "Int64"),
+            ("topic_persistence", persistence, "Int64"),
+        ]:
+            column = pd.Series(
+                "" if dtype is object else pd.NA, index=graid_data.index, dtype=dtype
+            )
+            column.iloc[mentions] = values
+            graid_data[col] = column
+        return graid_data
 
     def resolve_graid_p_word(self, word, graid, refind=[]):
         # print(word)
@@ -144,73 +339,120 @@ class CorpusFrame(pd.DataFrame):
             res.append({**word, **{"obj": obj, "gls": gls}, **ann})
         return res
 
-    def add_clause_ids(self, rec_list):
-        clause_counters = {"main": 0, "subr": 0}
-        res = []
+    def add_clause_ids(self, graid_data):
+        """Numbers main clauses (`clause`) and subordinate clauses
+        (`subr_clause`, empty outside of them)."""
+        types = graid_data["type"]
+        graid_data["clause"] = (types == "main_clause").cumsum().astype("int64")
+        subr_ids = []
+        counter = 0
         subrs = []
-        for rec in rec_list:
-            if rec["type"] == "main_clause":
-                clause_counters["main"] += 1
+        for item_type in types.to_numpy():
+            if item_type == "main_clause":
                 if subrs:
                     subrs.pop()
-            elif rec["type"] == "subr_clause":
-                clause_counters["subr"] += 1
-                subrs.append(clause_counters["subr"])
-                rec["subr_clause"] = clause_counters["subr"]
-            elif rec["type"] == "subr_end":
-                rec["subr_clause"] = subrs.pop()
-            elif subrs:
-                rec["subr_clause"] = subrs[-1]
-            rec["clause"] = clause_counters["main"]
-            res.append(rec)
-        return res
+                subr_ids.append(None)
+            elif item_type == "subr_clause":
+                counter += 1
+                subrs.append(counter)
+                subr_ids.append(counter)
+            elif item_type == "subr_end":
+                subr_ids.append(subrs.pop())
+            else:
+                subr_ids.append(subrs[-1] if subrs else None)
+        graid_data["subr_clause"] = pd.array(subr_ids, dtype="Int64")
+        return graid_data
 
     def add_record_param(self, item, rec):
         for k in self.record_level:
             item[k] = rec[k]
         return item
 
+    def graid_table(self, rec_list):
+        """The GRAID table: one row per element, with integer clause IDs,
+        information status and categorical GRAID values."""
+        graid_data = self.graid_frame(rec_list).fillna("")
+        graid_data = self.add_clause_ids(graid_data)
+        graid_data = self.get_information_status(graid_data)
+        for col in self.graid_cols + ["info"]:
+            if col in graid_data.columns:
+                graid_data[col] = graid_data[col].astype("category")
+        return graid_data
+
     def get_graid_recs(self, rec_list):
+        return self.graid_frame(rec_list).to_dict("records")
+
+    def graid_frame(self, rec_list):
+        """One row per GRAID element, with the aligned columns of its word.
+
+        Elements taking a RefIND value are numbered per word; the values are
+        then attached in one merge on (record, word, number) instead of being
+        popped off a list for every word.
+        """
         graid_recs = []
-        for rec in rec_list:
-            graid_data = rec["graid"]
-            word_idx = 0
-            while word_idx < len(graid_data):
-                ann_data = pygraid.parse_annotation(
-                    graid_data[word_idx], mode="structured"
-                ) or [[{}]]
-                if "refind" in rec and rec["refind"]:
-                    refind_data = rec["refind"][word_idx].split(" ")
-                else:
-                    refind_data = [""] * len(rec["srf"])
-                # print("orig", rec["refind"], "pos", word_idx, "current", refind_data)
+        slots = []  # row, record, word, number of the RefIND value
+        for rec_i, rec in enumerate(rec_list):
+            for word_idx, annotation in enumerate(rec["graid"]):
+                ann_data = parse_graid_annotation(annotation) or [[{}]]
+                n_ref = count()
+
+                def add(item, key):
+                    if key in item:
+                        slots.append((len(graid_recs), rec_i, word_idx, next(n_ref)))
+                    graid_recs.append(item)
+
                 for pre in ann_data["pre"]:
-                    if "syn" in pre and refind_data:
-                        pre["refind"] = refind_data.pop(0)
-                    self.add_record_param(pre, rec)
-                    graid_recs.append(pre)
+                    add(self.add_record_param(thaw(pre), rec), "syn")
                 word_dict = {col: rec[col][word_idx] for col in self.aligned_cols}
                 self.add_record_param(word_dict, rec)
                 if len(ann_data["data"]) == 1:
-                    graid_dict = ann_data["data"][0]
-                    if "ref" in graid_dict:
-                        word_dict["refind"] = refind_data.pop(0)
-                    graid_recs.append({**word_dict, **graid_dict})
+                    add({**word_dict, **thaw(ann_data["data"][0])}, "ref")
                 else:
-                    graid_recs.extend(
-                        self.resolve_graid_p_word(
-                            word=word_dict, graid=ann_data["data"], refind=refind_data
-                        )
+                    words = self.resolve_graid_p_word(
+                        word=word_dict,
+                        graid=thaw(ann_data["data"]),
+                        refind=[next(n_ref) for x in ann_data["data"] if "ref" in x],
                     )
+                    for item in words:
+                        if "ref" in item:
+                            slots.append(
+                                (len(graid_recs), rec_i, word_idx, item["refind"])
+                            )
+                        graid_recs.append(item)
                 for post in ann_data["post"]:
-                    if "syn" in post and refind_data:
-                        post["refind"] = refind_data.pop(0)
-                    self.add_record_param(post, rec)
-                    graid_recs.append(post)
-                word_idx += 1
-            if len(refind_data) > 0 and refind_data != [""]:
-                log.warning(f"Leftover refind annotation(s): {refind_data}")
-        return graid_recs
+                    add(self.add_record_param(thaw(post), rec), "syn")
+        graid_data = pd.DataFrame.from_dict(graid_recs)
+        refind = pd.DataFrame(
+            [
+                (rec_i, word_idx, value)
+                for rec_i, rec in enumerate(rec_list)
+                if "refind" in rec and rec["refind"]
+                for word_idx, value in enumerate(rec["refind"])
+            ],
+            columns=["rec_i", "word_idx", "refind"],
+        )
+        refind["refind"] = refind["refind"].str.split(" ")
+        refind = refind.explode("refind")
+        refind["n"] = refind.groupby(["rec_i", "word_idx"]).cumcount()
+        slots = pd.DataFrame(slots, columns=["row", "rec_i", "word_idx", "n"])
+        slots = slots.merge(refind, how="left", on=["rec_i", "word_idx", "n"])
+        if "refind" not in graid_data.columns:
+            graid_data["refind"] = None
+        graid_data.loc[slots["row"], "refind"] = slots["refind"].fillna("").values
+        used = slots.groupby(["rec_i", "word_idx"]).size()
+        leftover = refind[
+            (
+                refind["n"]
+                >= used.reindex(
+                    pd.MultiIndex.from_frame(refind[["rec_i", "word_idx"]]),
+                    fill_value=0,
+                ).values
+            )
+            & (refind["refind"] != "")
+        ]
+        if len(leftover) > 0:
+            log.warning(f"Leftover refind annotation(s): {list(leftover['refind'])}")
+        return graid_data
 
     def _tooltip(self, record, i, target_col):
         try:
@@ -366,20 +608,36 @@ class CorpusFrame(pd.DataFrame):
             )
             tqdm.write(f"Inconsistent number of interlinear items: {handle}")
 
-    def query(
-        self,
-        query_string,
-        name=None,
-        mode="bare",
-        conc_mode="html",
-        write=False,
-        add_col=["mid", "grm"],
-        **kwargs,
-    ):
-        add_col = [x for x in add_col if x in self.columns]
+    def word_table(self, cols=None):
+        """One row per word, see `lingcorp.stats.word_table`."""
+        return stats.word_table(self, cols or self.aligned_cols)
+
+    def frequencies(self, col="obj", top=None):
+        """Frequency list of the values of an aligned column."""
+        res = stats.frequencies(self.word_table(), col)
+        return res.head(top) if top else res
+
+    def ngrams(self, col="obj", n=2, top=None):
+        """Frequencies of sequences of `n` values within records."""
+        res = stats.ngrams(self.word_table(), col, n=n)
+        return res.head(top) if top else res
+
+    def collocations(self, col, node, node_col=None, window=3, measure="ll", top=None):
+        """Collocates of a node value, see `lingcorp.stats.collocations`."""
+        res = stats.collocations(
+            self.word_table(),
+            col,
+            node,
+            node_col=node_col,
+            window=window,
+            measure=measure,
+        )
+        return res.head(top) if top else res
+
+    def resolve_query(self, query_string):
+        """Parses a query, falling back to alternative readings (a plain word
+        form).  Returns the query string used and the parsed query, or None."""
         tokens = parse(query_string)
-        if name:
-            print(f"Name: {name}")
         alternatives = [f'[obj="{query_string}"]']
         i = 0
         while not tokens:
@@ -387,63 +645,38 @@ class CorpusFrame(pd.DataFrame):
             tokens = parse(query_string)
             i += 1
             if i >= len(alternatives):
-                return f"Invalid query: '{query_string}'"
-        roundtrip = " ".join(str(x) for x in tokens)
-        log.info(f"Searching for {query_string} ({roundtrip})")
-        rec_dics = {}
-        i = 0
-        for rec in tqdm(self.to_dict("records"), desc="Preparing word items"):
-            rec_dics[i] = []
-            for idx, dic in self.iter_words(rec, self.aligned_cols):
-                other_dic = {col: rec[col] for col in self.record_level if col in rec}
-                rec_dics[i].append({**dic, **{"idx": idx, "i": i}, **other_dic})
-            i += 1
-        kwics = []
-        for rec_idx, word_dics in tqdm(rec_dics.items(), desc="Building concordance"):
-            start = None
-            i = 0
-            j = 0
-            while i < len(word_dics) and j < len(
-                tokens
-            ):  # iterating through words in record and tokens
-                # print(f"comparing record {rec_idx}:{i} with token {j}")
-                # print(word_dics[i])
-                if tokens[j].match(word_dics[i]):  # a (partial) hit
-                    # print(f"token {j} matches {rec_idx}:{i}")
-                    if start is None:
-                        start = i
-                        # print(f"Searching from {rec_idx}:{start}")
-                    if j == len(tokens) - 1:
-                        # print(self.iloc[rec_idx])
-                        # print(f"Hit at {rec_idx}:{start}-{i} ({j})")
-                        if mode == "rich":
-                            kwics.append(
-                                self.build_conc_line(
-                                    self.iloc[rec_idx], start=start, end=i
-                                )
-                            )
-                        elif mode == "bare":
-                            kwics.append(
-                                self.build_conc_line(
-                                    self.iloc[rec_idx],
-                                    start=start,
-                                    end=i,
-                                    mode="bare",
-                                    add_col=add_col,
-                                )
-                            )
-                        else:
-                            raise ValueError(mode)
-                        j = 0
-                        start = None
-                    else:
-                        j += 1
-                else:
-                    # print("no hit")
-                    j = 0
-                    start = None
-                i += 1
+                break
+        return query_string, tokens
+
+    def word_items(self):
+        """Lists the word dicts of every record, as matched by queries."""
+        rec_dics = []
+        for i, rec in enumerate(
+            tqdm(self.to_dict("records"), desc="Preparing word items")
+        ):
+            other_dic = {col: rec[col] for col in self.record_level if col in rec}
+            rec_dics.append(
+                [
+                    {**dic, **{"idx": idx, "i": i}, **other_dic}
+                    for idx, dic in self.iter_words(rec, self.aligned_cols)
+                ]
+            )
+        return rec_dics
+
+    def conc_line(self, rec_idx, start, end, mode="bare", add_col=None):
+        if mode == "rich":
+            return self.build_conc_line(self.iloc[rec_idx], start=start, end=end)
+        if mode == "bare":
+            return self.build_conc_line(
+                self.iloc[rec_idx],
+                start=start,
+                end=end,
+                mode="bare",
+                add_col=add_col,
+            )
+        raise ValueError(mode)
 
+    def write_concordance(self, kwics, query_string, name=None, conc_mode="html"):
         if kwics:
             kwics = pd.DataFrame(kwics)
             if conc_mode == "html":
@@ -470,3 +703,71 @@ class CorpusFrame(pd.DataFrame):
                 return kwics
         log.warning(f"No results for '{query_string}'")
         return f"No results for '{query_string}'"
+
+    def query(
+        self,
+        query_string,
+        name=None,
+        mode="bare",
+        conc_mode="html",
+        write=False,
+        add_col=["mid", "grm"],
+        processes=None,
+        **kwargs,
+    ):
+        add_col = [x for x in add_col if x in self.columns]
+        if name:
+            print(f"Name: {name}")
+        query_string, tokens = self.resolve_query(query_string)
+        if not tokens:
+            return f"Invalid query: '{query_string}'"
+        log.info(f"Searching for {query_string} ({tokens})")
+        ((spans, seconds),) = scan([query_string], self.word_items(), processes)
+        kwics = [
+            self.conc_line(rec_idx, start, end, mode, add_col)
+            for rec_idx, start, end in tqdm(spans, desc="Building concordance")
+        ]
+        return self.write_concordance(kwics, query_string, name, conc_mode)
+
+    def query_batch(
+        self,
+        queries,
+        mode="bare",
+        conc_mode="csv",
+        add_col=["mid", "grm"],
+        processes=None,
+    ):
+        """Runs many named queries in a single pass over the words and writes
+        each concordance to `concordances/{name}.csv` (or `.html`).
+
+        Returns hit counts and search time (in seconds) per query name.
+        """
+        add_col = [x for x in add_col if x in self.columns]
+        compiled = {}
+        summary = {}
+        for name, query_string in queries.items():
+            resolved, tokens = self.resolve_query(query_string)
+            summary[name] = {"query": resolved, "hits": 0, "seconds": 0.0}
+            if tokens:
+                compiled[name] = tokens
+            else:
+                summary[name]["error"] = f"Invalid query: '{query_string}'"
+        results = scan(
+            [summary[name]["query"] for name in compiled], self.word_items(), processes
+        )
+        kwics = {}
+        for name, (spans, seconds) in zip(compiled, results):
+            summary[name]["seconds"] = seconds
+            kwics[name] = [
+                self.conc_line(rec_idx, start, end, mode, add_col)
+                for rec_idx, start, end in tqdm(spans, desc=f"Building {name}")
+            ]
+        for name, lines in kwics.items():
+            summary[name]["hits"] = len(lines)
+            if lines:
+                self.write_concordance(lines, summary[name]["query"], name, conc_mode)
+                summary[name]["path"] = str(self.conc_dir / f"{name}.{conc_mode}")
+            else:
+                log.warning(f"No results for '{summary[name]['query']}'")
+            summary[name]["seconds"] = round(summary[name]["seconds"], 6)
+        return summary
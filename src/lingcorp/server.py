@@ -1,7 +1,12 @@
+import copy
 import json
 import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from uuid import uuid4
 
 import pandas as pd
 import pygraid
@@ -12,6 +17,7 @@ from writio import dump
 
 from lingcorp.annotator import UniParser
 from lingcorp.config import OUTPUT_DIR
+from lingcorp.export import Exporter
 from lingcorp.helpers import (
     add_wid,
     get_pos,
@@ -21,6 +27,7 @@ from lingcorp.helpers import (
     render_graid,
     run_pipeline,
 )
+from lingcorp.locking import RecordLocks
 from lingcorp.search import CorpusFrame
 
 AUDIO_PATH = Path(config.get("audio_path", ""))
@@ -80,8 +87,8 @@ fields = {x["key"]: x for x in pipeline if isinstance(x, dict)}
 data = load_data(fields=fields)
 
 texts = None
+uniparser = None
 if data is not None:
-    uniparser = None
     for p in pipeline:
         if isinstance(p, UniParser):
             uniparser = p
@@ -119,12 +126,20 @@ if data is not None:
             break
 log.info("Annotation setup completed")
 
+# routes mutating a record hold its lock for the whole read-modify-write;
+# the shared DataFrame (and the pipeline annotators used for reparsing) and the
+# annotation dicts (and their YAML files) have a lock each
+record_locks = RecordLocks()
+frame_lock = threading.RLock()
+annotation_lock = threading.RLock()
+
 
 def save():
-    for key, field in fields.items():
-        if "file" not in field:
-            continue
-        dump(annotations[key], field["file"])
+    with annotation_lock:
+        for key, field in fields.items():
+            if "file" not in field:
+                continue
+            dump(annotations[key], field["file"])
 
 
 def defill(rec):
@@ -137,45 +152,95 @@ def defill(rec):
 
 def reparse(ex_id, target):
     log.debug(f"Reparsing {ex_id}")
-    if target == "ort":
-        for parser in pipeline:
-            if isinstance(parser, dict):
-                continue
-            data.loc[ex_id] = parser.parse(data.loc[ex_id])
-        data.loc[ex_id] = insert_pos_rec(data.loc[ex_id], pos_list=pos_list)
-        data.loc[ex_id] = add_wid(data.loc[ex_id])
-        load_annotations(key="graid", field=fields["graid"], data=data, rec_id=ex_id)
-    if target in ["ort", "graid"]:
-        res = list(parse_graid(data, target=ex_id))
-        return res[0]
-    return data.loc[ex_id]
+    with frame_lock:
+        if target == "ort":
+            for parser in pipeline:
+                if isinstance(parser, dict):
+                    continue
+                data.loc[ex_id] = parser.parse(data.loc[ex_id])
+            data.loc[ex_id] = insert_pos_rec(data.loc[ex_id], pos_list=pos_list)
+            data.loc[ex_id] = add_wid(data.loc[ex_id])
+            load_annotations(
+                key="graid", field=fields["graid"], data=data, rec_id=ex_id
+            )
+        if target in ["ort", "graid"]:
+            res = list(parse_graid(data, aligned_fields, target=ex_id))
+            return res[0]
+        return data.loc[ex_id]
 
 
-@app.route("/example/<exid>")
-def example_detail(exid):
-    ex = data.loc[exid]
+def get_record(r_id):
+    """Returns a record without observing a half-applied update."""
+    with record_locks(r_id), frame_lock:
+        return data.loc[r_id]
+
+
+def get_field_data(ex):
     field_data = {"precord": {}, "record": {}, "word": {}, "translations": {}}
     for key, field in fields.items():
         if key not in ex:
             continue
         field_data.setdefault(field["lvl"], {})
         field_data[field["lvl"]][key] = field
+    return field_data
+
+
+def no_uniparser():
+    return {"error": "There is no UniParser in the pipeline"}, 404
+
+
+# rendered record.html snippets, dropped whenever a record is edited
+rendered = {}
+
+
+def render_record(r_id):
+    with record_locks(r_id):
+        if r_id not in rendered:
+            ex = get_record(r_id)
+            rendered[r_id] = render_template(
+                "record.html", ex=ex, fields=get_field_data(ex), top_align="ann"
+            )
+        return rendered[r_id]
+
+
+# records are prefetched by a single worker; records already rendered or
+# waiting to be are not queued again
+prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+prefetching = set()
+prefetch_lock = threading.Lock()
+
+
+def prefetch_records(rec_ids):
+    with app.app_context():
+        for r_id in rec_ids:
+            try:
+                render_record(r_id)
+            finally:
+                with prefetch_lock:
+                    prefetching.discard(r_id)
+
+
+def schedule_prefetch(rec_ids):
+    with prefetch_lock:
+        rec_ids = [
+            r_id for r_id in rec_ids if r_id not in rendered and r_id not in prefetching
+        ]
+        prefetching.update(rec_ids)
+    if rec_ids:
+        prefetcher.submit(prefetch_records, rec_ids)
+
+
+@app.route("/example/<exid>")
+def example_detail(exid):
+    ex = get_record(exid)
     return render_template(
-        "rich_record.html", ex=ex, fields=field_data, top_align="ann"
+        "rich_record.html", ex=ex, fields=get_field_data(ex), top_align="ann"
     )
 
 
 @app.route("/example")
 def example():
-    exid = request.args.get("id")
-    ex = data.loc[exid]
-    field_data = {"precord": {}, "record": {}, "word": {}, "translations": {}}
-    for key, field in fields.items():
-        if key not in ex:
-            continue
-        field_data.setdefault(field["lvl"], {})
-        field_data[field["lvl"]][key] = field
-    return render_template("record.html", ex=ex, fields=field_data, top_align="ann")
+    return render_record(request.args.get("id"))
 
 
 @app.route("/graid")
@@ -214,39 +279,103 @@ def textrecords():
     return "None"
 
 
+@app.route("/textpage")
+def textpage():
+    """Returns a window of rendered records of a text.
+    The following window is rendered in the background.
+    """
+    if texts is None:
+        return "None"
+    text_id = request.args.get("textID")
+    if not text_id:
+        return "None"
+    rec_ids = texts[text_id]
+    start = int(request.args.get("start", 0))
+    size = int(request.args.get("size", config.get("page_size", 50)))
+    end = min(start + size, len(rec_ids))
+    html = "".join(render_record(r_id) for r_id in rec_ids[start:end])
+    if end < len(rec_ids):
+        schedule_prefetch(rec_ids[end : end + size])
+        next_start = end
+    else:
+        next_start = None
+    return {
+        "html": html,
+        "start": start,
+        "end": end,
+        "total": len(rec_ids),
+        "next": next_start,
+    }
+
+
+# running and finished exports, by job ID; finished jobs are removed once
+# their final status has been read, or after EXPORT_KEEP seconds
+exports = {}
+exports_lock = threading.Lock()
+EXPORT_KEEP = 600
+
+
+def prune_exports():
+    now = time.monotonic()
+    with exports_lock:
+        for job_id, exporter in list(exports.items()):
+            if exporter.finished is not None and now - exporter.finished > EXPORT_KEEP:
+                del exports[job_id]
+
+
 @app.route("/export")
 def export():
-    defilled_data = data.apply(defill, axis=1)
-    defilled_data.drop(columns=["ann", "audio", "ana", "anas"], inplace=True)
-    for col in splitcols:
-        if col in defilled_data.columns:
-            if isinstance(defilled_data[col].iloc[0][0], list):
-                defilled_data[col] = defilled_data[col].apply(
-                    lambda x: [",".join(y) for y in x]
-                )
-            defilled_data[col] = defilled_data[col].apply(lambda x: "\t".join(x))
-    for key, field_data in fields.items():
-        if key in defilled_data.columns and "label" in field_data:
-            defilled_data.rename(columns={key: field_data["label"]}, inplace=True)
-    defilled_data.to_csv("output/test.csv", index=False)
-    return {}
+    filename = request.args.get("filename", config.get("export_file", "export.csv"))
+    exporter = Exporter(
+        OUTPUT_DIR / Path(filename).name,
+        fmt=request.args.get("format"),
+        list_cols=splitcols,
+        drop=["ann", "audio", "ana", "anas"],
+        labels={
+            key: field["label"] for key, field in fields.items() if "label" in field
+        },
+        lock=frame_lock,
+    )
+    prune_exports()
+    job_id = uuid4().hex  # unique across concurrent requests
+    with exports_lock:
+        exports[job_id] = exporter
+    threading.Thread(target=exporter.write, args=(data,), daemon=True).start()
+    return {"job": job_id, **exporter.progress()}
+
+
+@app.route("/export/progress")
+def export_progress():
+    job_id = request.args.get("job")
+    with exports_lock:
+        exporter = exports.get(job_id)
+        if exporter is None:
+            return {"error": f"No export job {job_id}"}, 404
+        if exporter.finished is not None:
+            del exports[job_id]
+    return exporter.progress()
+
+
+def apply_choice(rec, pos, choice):
+    """Fills in the fields of the word at `pos` from the analysis `choice`."""
+    for field in ["obj", "gls", "lex", "grm", "mid"]:
+        rec[field][pos] = rec["anas"][pos][choice].get(field, "")
+    rec["pos"][pos] = get_pos(rec["grm"][pos], pos_list)
 
 
 def set_up_choice(rec, orig_pos, shifted_pos, choice):
     log.debug(f"Shifting {rec['ID']} from {orig_pos} to {shifted_pos}")
     if rec["anas"][int(orig_pos)][choice] != "?":
-        for field in ["obj", "gls", "lex", "grm", "mid"]:
-            rec[field][int(orig_pos)] = rec["anas"][int(orig_pos)][choice].get(
-                field, ""
+        apply_choice(rec, int(orig_pos), choice)
+        with annotation_lock:
+            uniparser.register_choice(
+                rec["ID"], orig_pos, rec["anas"][int(orig_pos)][choice]["srf"], choice
             )
-        rec["pos"][int(orig_pos)] = get_pos(rec["grm"][int(orig_pos)], pos_list)
-        uniparser.register_choice(
-            rec["ID"], orig_pos, rec["anas"][int(orig_pos)][choice]["srf"], choice
-        )
     else:
         for field in ["gls", "lex", "grm", "mid", "pos"]:
             rec[field][int(orig_pos)] = "?"
-        uniparser.discard_choice(rec["ID"], orig_pos)
+        with annotation_lock:
+            uniparser.discard_choice(rec["ID"], orig_pos)
     rec["ana"][int(orig_pos)] = choice
 
 
@@ -257,56 +386,202 @@ def pick():
     values = target.split("_")
     r_id, key, orig_pos, shifted_pos = values
     # print("Picking", choice, r_id, key, orig_pos, shifted_pos)
-    set_up_choice(data.loc[r_id], orig_pos, shifted_pos, choice)
-    ex = data.loc[r_id]
-    field_data = {}
-    for key, field in fields.items():
-        if key not in ex:
-            continue
-        field_data.setdefault(field["lvl"], {})
-        field_data[field["lvl"]][key] = field
-    return render_template("record.html", ex=ex, fields=field_data, top_align="ann")
+    with record_locks(r_id):
+        with frame_lock:
+            rec = data.loc[r_id]
+        set_up_choice(rec, orig_pos, shifted_pos, choice)
+        rendered.pop(r_id, None)
+        return render_record(r_id)
 
 
-@app.route("/update")
-def update():
-    value = request.args.get("value")
-    target = request.args.get("target")
+def split_target(target):
+    """Splits an input ID of the form <record>_<key>[_<position>]."""
     values = target.split("_")
-    if len(values) == 1:
-        raise ValueError(target)
-    elif len(values) == 2:
-        # print("updating", value, target, values)
+    if len(values) == 2:
         r_id, key = values
-        data.at[r_id, key] = value
-        if value:
-            # print("setting", key, "annotation for", r_id, "to", value)
-            annotations[key][r_id] = value
-        elif r_id in annotations[key]:
-            # print("empty value, deleting", key, "for", r_id)
-            del annotations[key][r_id]
-        else:
-            log.debug(f"{r_id} is not in {annotations[key]}")
-            raise ValueError(r_id)
-        data.loc[r_id] = defill(data.loc[r_id])
-        data.loc[r_id] = reparse(r_id, target=key)
-    elif len(values) == 3:
+        return r_id, key, None
+    if len(values) == 3:
         r_id, key, pos = values
-        pos = int(pos)
-        data.loc[r_id] = defill(data.loc[r_id])
-        data.at[r_id, key][pos] = value
-        if value:
-            ref_value = data.at[r_id, fields[key]["ref"]][pos]
-            annotations[key].setdefault(r_id, {})
-            annotations[key][r_id].setdefault(pos, {})
-            annotations[key][r_id][pos][ref_value] = value
-        elif key in annotations and pos in annotations[key][r_id]:
-            del annotations[key][r_id][pos]
-        data.loc[r_id] = reparse(r_id, target=key)
-    save()
+        return r_id, key, int(pos)
+    raise ValueError(target)
+
+
+def apply_edit(r_id, key, value, pos=None):
+    """Sets a record- or word-level value and registers it in the annotations.
+    The record is expected to be defilled; reparsing and saving is left to the caller.
+    """
+    if pos is None:
+        with frame_lock:
+            data.at[r_id, key] = value
+        with annotation_lock:
+            if value:
+                # print("setting", key, "annotation for", r_id, "to", value)
+                annotations[key][r_id] = value
+            elif r_id in annotations[key]:
+                # print("empty value, deleting", key, "for", r_id)
+                del annotations[key][r_id]
+            else:
+                log.debug(f"{r_id} is not in {annotations[key]}")
+                raise ValueError(r_id)
+    else:
+        with frame_lock:
+            data.at[r_id, key][pos] = value
+            if value:
+                ref_value = data.at[r_id, fields[key]["ref"]][pos]
+        with annotation_lock:
+            if value:
+                annotations[key].setdefault(r_id, {})
+                annotations[key][r_id].setdefault(pos, {})
+                annotations[key][r_id][pos][ref_value] = value
+            elif key in annotations and pos in annotations[key][r_id]:
+                del annotations[key][r_id][pos]
+
+
+def reparse_target(keys):
+    """The most comprehensive reparse needed after editing the given fields."""
+    for target in ["ort", "graid"]:
+        if target in keys:
+            return target
+    return keys[-1]
+
+
+@app.route("/update")
+def update():
+    value = request.args.get("value")
+    r_id, key, pos = split_target(request.args.get("target"))
+    with record_locks(r_id):
+        with frame_lock:
+            data.loc[r_id] = defill(data.loc[r_id])
+        apply_edit(r_id, key, value, pos)
+        with frame_lock:
+            data.loc[r_id] = reparse(r_id, target=key)
+        rendered.pop(r_id, None)
+        save()
     return {"updated": r_id}
 
 
+@app.route("/batch_update", methods=["POST"])
+def batch_update():
+    """Applies a list of edits, each either {"target": <input ID>, "value": ...}
+    or {"rec": ..., "key": ..., "pos": ..., "value": ...}.
+    Either all edits are applied or none; every affected record is reparsed
+    once and the annotations are saved once.  Invalid edits are answered with
+    400 and the first of them.
+    """
+    edits = {}
+    for edit in request.get_json()["edits"]:
+        try:
+            if "target" in edit:
+                r_id, key, pos = split_target(edit["target"])
+            else:
+                r_id, key, pos = edit["rec"], edit["key"], edit.get("pos")
+                if pos is not None:
+                    pos = int(pos)
+        except (KeyError, TypeError, ValueError):
+            return {"error": "Invalid edit", "edit": edit}, 400
+        if r_id not in data.index:
+            return {"error": f"Unknown record '{r_id}'", "edit": edit}, 400
+        if key not in annotations:
+            return {"error": f"Unknown field '{key}'", "edit": edit}, 400
+        edits.setdefault(r_id, []).append((key, pos, edit.get("value", "")))
+    with record_locks(*edits):
+        with frame_lock:
+            rec_backup = {
+                r_id: {k: copy.deepcopy(v) for k, v in data.loc[r_id].items()}
+                for r_id in edits
+            }
+        with annotation_lock:
+            ann_backup = {
+                (key, r_id): copy.deepcopy(annotations[key].get(r_id))
+                for r_id, rec_edits in edits.items()
+                for key, _, _ in rec_edits
+            }
+        try:
+            for r_id, rec_edits in edits.items():
+                with frame_lock:
+                    data.loc[r_id] = defill(data.loc[r_id])
+                for key, pos, value in rec_edits:
+                    apply_edit(r_id, key, value, pos)
+                target = reparse_target([key for key, _, _ in rec_edits])
+                with frame_lock:
+                    data.loc[r_id] = reparse(r_id, target=target)
+                rendered.pop(r_id, None)
+        except Exception:
+            log.error("Batch update failed, rolling back")
+            with frame_lock:
+                for r_id, rec in rec_backup.items():
+                    data.loc[r_id] = pd.Series(rec)
+            with annotation_lock:
+                for (key, r_id), value in ann_backup.items():
+                    if value is None:
+                        annotations[key].pop(r_id, None)
+                    else:
+                        annotations[key][r_id] = value
+            raise
+        save()
+    return {"updated": list(edits)}
+
+
+@app.route("/disambiguation")
+def disambiguation():
+    """The unresolved ambiguities, grouped by form and candidate analyses,
+    the groups with the most tokens first."""
+    if uniparser is None:
+        return no_uniparser()
+    top = int(request.args.get("top", 50))
+    with annotation_lock:
+        groups = uniparser.queue.ranked()[:top]
+        total = len(uniparser.queue)
+    return {
+        "tokens": total,
+        "groups": [
+            {
+                "form": form,
+                "candidates": candidates,
+                "tokens": len(contexts),
+                "contexts": [
+                    {"rec": rec_id, "pos": pos, **info}
+                    for (rec_id, pos), info in contexts
+                ],
+            }
+            for form, candidates, contexts in groups
+        ],
+    }
+
+
+@app.route("/resolve", methods=["POST"])
+def resolve():
+    """Applies one analysis to all occurrences of a form with the given
+    candidates: {"form": ..., "candidates": [...], "choice": ..., "overrides":
+    [{"rec": ..., "pos": ..., "choice": <analysis or null to skip>}]}"""
+    if uniparser is None:
+        return no_uniparser()
+    args = request.get_json()
+    try:
+        overrides = {
+            (x["rec"], int(x["pos"])): x.get("choice")
+            for x in args.get("overrides", [])
+        }
+        form, candidates, choice = args["form"], args["candidates"], args["choice"]
+    except (KeyError, TypeError, ValueError):
+        return {"error": "Expected form, candidates, choice and overrides"}, 400
+    with annotation_lock:
+        decisions = uniparser.resolve(form, candidates, choice, overrides)
+    by_record = {}
+    for r_id, pos, choice in decisions:
+        by_record.setdefault(r_id, []).append((pos, choice))
+    with record_locks(*by_record):
+        for r_id, choices in by_record.items():
+            with frame_lock:
+                rec = data.loc[r_id]
+            for pos, choice in choices:
+                if choice in rec["anas"][pos]:
+                    apply_choice(rec, pos, choice)
+                    rec["ana"][pos] = choice
+            rendered.pop(r_id, None)
+    return {"resolved": len(decisions), "updated": list(by_record)}
+
+
 def build_example_div(ex_ids, audio=None):
     ex = data.loc[ex_ids]
     field_data = {}
@@ -363,5 +638,27 @@ def search():
     return df.query(query, name=None, mode="rich")
 
 
+@app.route("/stats")
+def corpus_stats():
+    filename = request.args.get("filename", config.get("output_file", "parsed.csv"))
+    df = CorpusFrame(OUTPUT_DIR / Path(filename).name, list_cols=["mid", "grm"])
+    col = request.args.get("col", "obj")
+    top = int(request.args.get("top", 100))
+    if request.args.get("node"):
+        res = df.collocations(
+            col,
+            request.args.get("node"),
+            node_col=request.args.get("node_col"),
+            window=int(request.args.get("window", 3)),
+            measure=request.args.get("measure", "ll"),
+            top=top,
+        )
+    elif int(request.args.get("n", 1)) > 1:
+        res = df.ngrams(col, n=int(request.args.get("n")), top=top)
+    else:
+        res = df.frequencies(col, top=top)
+    return res.to_html(index=False)
+
+
 def run_server():
-    app.run(debug=True, port=5001)
+    app.run(debug=True, port=5001, threaded=config.get("threaded", True))
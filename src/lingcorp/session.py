@@ -0,0 +1,102 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from writio import dump
+
+log = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Write-behind persistence for interactive annotation sessions.
+
+    Changes are applied in memory and appended to a journal (one JSON line
+    per change).  The registered files are only rewritten every `every`
+    changes, every `interval` seconds (if anything changed) and on exit;
+    after that, the journal is emptied.  If a session crashes, the changes
+    since the last flush are replayed from the journal on the next start.
+    """
+
+    def __init__(self, journal_path, apply, every=20, interval=30):
+        self.journal_path = Path(journal_path)
+        self.apply = apply
+        self.every = every
+        self.interval = interval
+        self.files = {}
+        self.pending = 0
+        self.lock = threading.RLock()
+        self._journal = None
+        self._stop = threading.Event()
+        self._timer = None
+
+    def register(self, path, content):
+        """`content` returns the data to be written to `path`."""
+        self.files[Path(path)] = content
+
+    def start(self):
+        """Replays an unfinished journal, then starts the flush timer."""
+        if self.journal_path.is_file():
+            entries = self.journal_path.read_text(encoding="utf-8").splitlines()
+            for line in entries:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # interrupted while writing
+                    continue
+                self.apply(*entry)
+            if entries:
+                log.info(f"Recovered {len(entries)} answer(s) from {self.journal_path}")
+                self.pending = len(entries)
+                self.flush()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if self.interval:
+            self._timer = threading.Thread(target=self._run_timer, daemon=True)
+            self._timer.start()
+        atexit.register(self.close)
+        return self
+
+    def record(self, *entry):
+        """Applies a change and journals it."""
+        self.record_many([entry])
+
+    def record_many(self, entries):
+        """Applies and journals many changes with a single sync."""
+        with self.lock:
+            for entry in entries:
+                self.apply(*entry)
+                self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self.pending += 1
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if self.pending >= self.every:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            for path, content in self.files.items():
+                tmp_path = path.with_name(f".{path.stem}.tmp{path.suffix}")
+                dump(content(), tmp_path)
+                os.replace(tmp_path, path)
+            if self._journal:
+                self._journal.seek(0)
+                self._journal.truncate()
+            else:
+                self.journal_path.unlink(missing_ok=True)
+            self.pending = 0
+
+    def _run_timer(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+            self.journal_path.unlink(missing_ok=True)
+        atexit.unregister(self.close)
@@ -1,31 +1,57 @@
-function loadText(textID) {
+// records are loaded in windows, the next one when the end of the list comes into view
+var currentText = null;
+var nextStart = null;
+var loadingPage = false;
+
+function loadPage(textID, start) {
+  loadingPage = true;
   $.get({
-    url: "/textrecords",
-    async: false,
-    data: { textID: textID },
+    url: "/textpage",
+    data: { textID: textID, start: start },
     success: function (data) {
-      if (data != "None") {
-        var exampleIDs = data;
-        console.log(
-          "Loaded text " + textID + " (" + exampleIDs.length + "records)",
-        );
-        $("#examples li").remove();
-        for (let i = 0; i < exampleIDs.length; i++) {
-          $.get({
-            url: "/example",
-            data: { id: exampleIDs[i] },
-            async: true,
-            success: function (data) {
-              $("#examples").append(data);
-            },
-          });
-          fitAll();
-        }
+      if (textID != currentText) {
+        return; // the flag belongs to the request for the current text
+      }
+      loadingPage = false;
+      if (data == "None") {
+        return;
+      }
+      $("#examples").append(data.html);
+      fitAll();
+      nextStart = data.next;
+      console.log(
+        "Loaded records " + data.start + "-" + data.end + " of " + data.total,
+      );
+      if (nextStart !== null && endInView()) {
+        loadPage(textID, nextStart);
+      }
+    },
+    error: function () {
+      if (textID == currentText) {
+        loadingPage = false; // try again on the next scroll
       }
     },
   });
 }
 
+function endInView() {
+  var end = $("#examplesEnd");
+  return end.length && end.offset().top < $(window).scrollTop() + 2 * $(window).height();
+}
+
+function loadText(textID) {
+  currentText = textID;
+  nextStart = null;
+  $("#examples li").remove();
+  loadPage(textID, 0);
+}
+
+$(window).on("scroll", function () {
+  if (!loadingPage && nextStart !== null && endInView()) {
+    loadPage(currentText, nextStart);
+  }
+});
+
 $("#textlist").on("click", ".list-group-item", function () {
   loadText($(this).attr("id"));
   var listItems = $(".list-group-item");
@@ -54,14 +80,64 @@ $(document).on("input", "input", function (event) {
   fit(this);
 });
 
-$(document).on("change", "input", function (event) {
-  res = $(this).val();
-  id = $(this).attr("id");
-  exampleItem = $(this).parents("li")[0];
+// edits are collected and sent in batches
+var pendingEdits = {};
+var flushTimer = null;
+
+function flushEdits(callback) {
+  clearTimeout(flushTimer);
+  var edits = Object.keys(pendingEdits).map(function (target) {
+    return { target: target, value: pendingEdits[target] };
+  });
+  pendingEdits = {};
+  if (edits.length == 0) {
+    if (callback) {
+      callback();
+    }
+    return;
+  }
   $.ajax({
-    url: "/update",
-    data: { value: res, target: id },
+    url: "/batch_update",
+    type: "POST",
+    contentType: "application/json",
+    data: JSON.stringify({ edits: edits }),
+    success: function (data) {
+      if (callback) {
+        callback(data);
+      }
+    },
+    error: function (xhr) {
+      // keep the edits for the next flush, except one the server rejected
+      var response = xhr.responseJSON || {};
+      edits.forEach(function (edit) {
+        if (response.edit && response.edit.target == edit.target) {
+          return;
+        }
+        if (!(edit.target in pendingEdits)) {
+          pendingEdits[edit.target] = edit.value;
+        }
+      });
+      alert("Saving failed: " + (response.error || xhr.statusText));
+    },
+  });
+}
+
+$(document).on("change", "input", function (event) {
+  pendingEdits[$(this).attr("id")] = $(this).val();
+  clearTimeout(flushTimer);
+  flushTimer = setTimeout(flushEdits, 1000);
+});
+
+$(window).on("beforeunload", function () {
+  var edits = Object.keys(pendingEdits).map(function (target) {
+    return { target: target, value: pendingEdits[target] };
   });
+  if (edits.length > 0) {
+    navigator.sendBeacon(
+      "/batch_update",
+      new Blob([JSON.stringify({ edits: edits })], { type: "application/json" }),
+    );
+  }
 });
 
 function fitAll() {
@@ -78,23 +154,18 @@ $(function () {
   $(document).on("keypress", "input", function (event) {
     var keycode = event.keyCode ? event.keyCode : event.which;
     if (keycode == "13") {
-      res = $(this).val();
-      id = $(this).attr("id");
+      pendingEdits[$(this).attr("id")] = $(this).val();
       exampleItem = $(this).parents("li")[0];
-      $.ajax({
-        url: "/update",
-        data: { value: res, target: id },
-        success: function (data) {
-          $.ajax({
-            url: "/example/",
-            data: { id: exampleItem.id },
-            success: function (result) {
-              result = $.parseHTML(result);
-              exampleItem.replaceWith(result[1]);
-              fitAll();
-            },
-          });
-        },
+      flushEdits(function (data) {
+        $.ajax({
+          url: "/example/",
+          data: { id: exampleItem.id },
+          success: function (result) {
+            result = $.parseHTML(result);
+            exampleItem.replaceWith(result[1]);
+            fitAll();
+          },
+        });
       });
     }
   });
@@ -0,0 +1,125 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+MEASURES = ["mi", "t", "ll", "log_dice"]
+
+
+def word_table(data, cols):
+    """One row per word with the aligned `cols`, the record number (`rec_i`)
+    and the position of the word in the record (`idx`).
+
+    Records whose columns have differing numbers of words are skipped.
+    """
+    data = data[cols].reset_index(drop=True)
+    lengths = data.apply(lambda col: col.map(len))
+    consistent = lengths.nunique(axis=1) == 1
+    if not consistent.all():
+        log.warning(
+            f"Skipping {(~consistent).sum()} records with inconsistent numbers of words"
+        )
+        data = data[consistent]
+    words = data.explode(cols)
+    words = words[words[cols[0]].notna()]
+    words.insert(0, "rec_i", words.index)
+    words.insert(1, "idx", words.groupby(level=0).cumcount())
+    return words.reset_index(drop=True)
+
+
+def _values(series):
+    """Flattens list values (e.g. `grm` tag bundles) into separate items."""
+    if series.map(lambda x: isinstance(x, list)).any():
+        series = series.explode()
+    return series[series.notna() & (series != "")]
+
+
+def matches(series, value):
+    """Words whose value is, or contains, `value`."""
+    return series.map(lambda x: value in x if isinstance(x, list) else x == value)
+
+
+def frequencies(words, col):
+    counts = _values(words[col]).value_counts()
+    res = pd.DataFrame({col: counts.index, "count": counts.values})
+    res["relative"] = res["count"] / res["count"].sum()
+    res["per_million"] = res["relative"] * 1_000_000
+    return res
+
+
+def ngrams(words, col, n=2):
+    values = words[col].map(lambda x: ",".join(x) if isinstance(x, list) else x)
+    grams = pd.DataFrame({f"{col}_1": values})
+    for k in range(1, n):
+        shifted = values.groupby(words["rec_i"]).shift(-k)
+        grams[f"{col}_{k + 1}"] = shifted
+    grams = grams.dropna()
+    counts = grams.value_counts().reset_index(name="count")
+    counts["relative"] = counts["count"] / len(grams) if len(grams) else 0.0
+    return counts
+
+
+def collocations(words, col, node, node_col=None, window=3, measure="ll"):
+    """Collocates of the words whose `node_col` value is (or contains) `node`
+        within `window` words to the left and right, with association scores.
+
+        The contingency table compares the collocate's frequency in the windows
+        around the node to its frequency in the corpus: `mi` (pointwise mutual
+        information), `t` (t-score), `ll` (log-likelihood, G², negative for
+    collocates occurring less often than expected) and `log_dice`.
+    """
+    node_col = node_col or col
+    is_node = matches(words[node_col], node)
+    node_freq = int(is_node.sum())
+    values = words[col]
+    rec_i = words["rec_i"].to_numpy()
+    nodes = np.flatnonzero(is_node.to_numpy())
+    positions = []
+    for k in range(-window, window + 1):
+        if k == 0:
+            continue
+        shifted = nodes + k
+        valid = (shifted >= 0) & (shifted < len(words))
+        valid[valid] = rec_i[shifted[valid]] == rec_i[nodes[valid]]
+        positions.append(shifted[valid])
+    # words in the windows of several nodes are only counted once
+    positions = np.unique(np.concatenate(positions)) if positions else []
+    context = values.iloc[positions]
+    context = _values(context)
+    observed = context.value_counts()
+    corpus = _values(values).value_counts()
+    total, in_window = corpus.sum(), len(context)
+    res = pd.DataFrame({col: observed.index, "observed": observed.values})
+    res["frequency"] = corpus.reindex(observed.index).fillna(0).values
+    res["expected"] = in_window * res["frequency"] / total
+    res["mi"] = np.log2(res["observed"] / res["expected"])
+    res["t"] = (res["observed"] - res["expected"]) / np.sqrt(res["observed"])
+    # negative for collocates that are rarer near the node than expected
+    res["ll"] = np.sign(res["observed"] - res["expected"]) * _log_likelihood(
+        res["observed"], res["frequency"], in_window, total
+    )
+    res["log_dice"] = 14 + np.log2(2 * res["observed"] / (node_freq + res["frequency"]))
+    return res.sort_values(measure, ascending=False, ignore_index=True)
+
+
+def _log_likelihood(o11, c1, r1, n):
+    o12 = r1 - o11
+    o21 = c1 - o11
+    o22 = n - r1 - o21
+    r2 = n - r1
+    c2 = n - c1
+    cells = [
+        (o11, r1 * c1 / n),
+        (o12, r1 * c2 / n),
+        (o21, r2 * c1 / n),
+        (o22, r2 * c2 / n),
+    ]
+    res = 0
+    for observed, expected in cells:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            res = res + np.where(
+                observed > 0, observed * np.log(observed / expected), 0
+            )
+    return 2 * res
@@ -0,0 +1,91 @@
+from collections import Counter
+
+
+class SuggestionIndex:
+    """Running counts of the answers given for each key (a word form, a GRAID
+    annotation...), with the most frequent answer kept up to date on every
+    `add`, so suggestions do not need to recount a history of answers.
+
+    Persisted as `{key: {answer: count}}`; the older format of answer lists
+    (`{key: [answer, answer, ...]}`) is read as well.
+    """
+
+    def __init__(self, data=None):
+        self.counts = {}
+        self.totals = {}
+        self.best = {}
+        for key, answers in (data or {}).items():
+            if isinstance(answers, dict):
+                answers = answers.items()
+            else:
+                answers = Counter(answers).items()
+            for answer, count in answers:
+                self.add(key, answer, count)
+
+    def add(self, key, answer, count=1):
+        counts = self.counts.setdefault(key, Counter())
+        counts[answer] += count
+        self.totals[key] = self.totals.get(key, 0) + count
+        best = self.best.get(key)
+        if best is None or counts[answer] > counts[best]:
+            self.best[key] = answer
+
+    def favorite(self, key, default=""):
+        return self.best.get(key, default)
+
+    def confidence(self, key, candidates=None):
+        """The favorite answer for `key` (among `candidates`, if given), how
+        often it was given, and its share of all answers for `key`."""
+        counts = self.counts.get(key)
+        if not counts:
+            return None, 0, 0.0
+        if candidates is None:
+            answer = self.best[key]
+        else:
+            answer = max(candidates, key=lambda x: counts[x], default=None)
+            if answer is None or not counts[answer]:
+                return None, 0, 0.0
+        return answer, counts[answer], counts[answer] / self.totals[key]
+
+    def top(self, key, n=None):
+        return [x for x, count in self.counts.get(key, Counter()).most_common(n)]
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def to_data(self):
+        return {key: dict(counts) for key, counts in self.counts.items()}
+
+
+class RankedCounter:
+    """Counts kept in descending order: incrementing a count moves the key up
+    past the keys it overtakes, so the ranking never has to be re-sorted."""
+
+    def __init__(self, keys=()):
+        self.counts = {}
+        self.order = []
+        self.rank = {}
+        for key in keys:
+            self.add(key, 0)
+
+    def add(self, key, count=1):
+        if key not in self.counts:
+            self.counts[key] = 0
+            self.rank[key] = len(self.order)
+            self.order.append(key)
+        self.counts[key] += count
+        i = self.rank[key]
+        while i > 0 and self.counts[self.order[i - 1]] < self.counts[key]:
+            above = self.order[i - 1]
+            self.order[i], self.rank[above] = above, i
+            i -= 1
+        self.order[i], self.rank[key] = key, i
+
+    def ranked(self, keys, first=None):
+        """`keys` in descending order of their counts, `first` in front."""
+        keys = list(keys)
+        wanted = set(keys)
+        res = [first] if first in wanted else []
+        res.extend(x for x in self.order if x in wanted and x != first)
+        res.extend(x for x in keys if x not in self.rank and x != first)
+        return res
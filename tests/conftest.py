@@ -0,0 +1,36 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+sys.path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
+
+from corpus import generate  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def server_project(tmp_path_factory):
+    """A synthetic project (see benchmarks/corpus.py) with the annotation
+    server loaded for it; the server module can only be loaded once."""
+    path = tmp_path_factory.mktemp("project")
+    generate(path, records=60, words=6, vocabulary=80, texts=2)
+    cwd = os.getcwd()
+    os.chdir(path)
+    sys.path.insert(0, str(path))
+    try:
+        for module in ["conf", "lingcorp.server"]:
+            sys.modules.pop(module, None)
+        server = importlib.import_module("lingcorp.server")
+    finally:
+        os.chdir(cwd)
+    return path, server
+
+
+@pytest.fixture
+def server(server_project, monkeypatch):
+    path, server = server_project
+    monkeypatch.chdir(path)  # annotations are saved to the project
+    return server
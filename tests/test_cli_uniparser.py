@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from lingcorp.analyzer_service import AnalyzerService, RemoteAnalyzer, create_app
+from lingcorp.cli import annotator
+from lingcorp.config import ID_KEY
+from lingcorp.helpers import uniparser_fields
+
+LEXEMES = """-lexeme
+ lex: po
+ stem: po.
+ gramm: N
+ paradigm: N
+ gloss: thing
+
+-lexeme
+ lex: ri
+ stem: ri.
+ gramm: V
+ paradigm: V
+ gloss: go
+
+-lexeme
+ lex: ri
+ stem: ri.
+ gramm: V
+ paradigm: V
+ gloss: walk
+"""
+
+PARADIGMS = """-paradigm: N
+ -flex: .
+  gramm: sg
+
+-paradigm: V
+ -flex: .
+  gramm: prs
+"""
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    grammar = tmp_path / "grammar"
+    grammar.mkdir()
+    (grammar / "lexemes.txt").write_text(LEXEMES, encoding="utf-8")
+    (grammar / "paradigms.txt").write_text(PARADIGMS, encoding="utf-8")
+    monkeypatch.chdir(tmp_path)  # uniparser and the annotator write here
+    service = AnalyzerService(grammar)
+    service.load()
+    server = make_server("127.0.0.1", 0, create_app(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield RemoteAnalyzer(f"http://127.0.0.1:{server.server_port}")
+    server.shutdown()
+
+
+def parse(parser, transcription):
+    record = {ID_KEY: "r1", "transcription": transcription, "Translation": ""}
+    res = parser.parse(record)
+    parser.write()
+    return res
+
+
+def test_ambiguity_with_remote_analyzer(remote):
+    parser = annotator.UniParser(
+        name="morpho",
+        analyzer=remote,
+        interactive=False,
+        uniparser_fields=uniparser_fields,
+    )
+    record = parse(parser, "po ri")
+    assert record["gls"] == ["thing", "?"]
+    assert record["obj"] == ["po", "ri"]
+
+
+def test_declined_choice_with_remote_analyzer(remote, monkeypatch):
+    class Answer:
+        def ask(self):
+            return "I'd rather not choose."
+
+    monkeypatch.setattr(annotator.questionary, "select", lambda *a, **kw: Answer())
+    parser = annotator.UniParser(
+        name="morpho", analyzer=remote, uniparser_fields=uniparser_fields
+    )
+    record = parse(parser, "po ri")
+    assert record["gls"] == ["thing", "***"]
+    assert parser.annotated == {}
@@ -0,0 +1,53 @@
+import random
+import re
+
+import pytest
+
+from lingcorp.cql import parse
+
+# CQL tokens over words of one letter, with equivalent regular expressions
+TOKENS = [
+    ('[obj="a"]', "a"),
+    ('[obj!="b"]', "[^bB]"),
+    ('[obj=="c"]', "c"),
+    ("[]", "."),
+    ('[obj="a"|obj="c"]', "[ac]"),
+    ('[obj="b"&gls="x"]', "B"),
+]
+QUANTIFIERS = ["", "", "?", "*", "+", "{2}", "{1,3}", "{0,2}", "{2,}"]
+
+
+def oracle(pattern, text, within=None):
+    """The longest non-empty match at every start, found by brute force."""
+    res = []
+    for start in range(len(text)):
+        last = len(text) if within is None else min(len(text), start + within)
+        for end in range(last, start, -1):
+            if re.fullmatch(pattern, text[start:end]):
+                res.append((start, end - 1))
+                break
+    return res
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_automaton_matches_regex(seed):
+    rng = random.Random(seed)
+    query, pattern = "", ""
+    for _ in range(rng.randint(1, 3)):
+        cql, regex = rng.choice(TOKENS)
+        quantifier = rng.choice(QUANTIFIERS)
+        query += cql + quantifier
+        pattern += f"(?:{regex}){quantifier}"
+    within = rng.choice([None, None, rng.randint(1, 6)])
+    if within:
+        query += f" within {within}"
+    text = "".join(rng.choice("aabcB") for _ in range(rng.randint(0, 15)))
+    words = [
+        {"obj": "b", "gls": "x"} if x == "B" else {"obj": x, "gls": "y"} for x in text
+    ]
+    assert list(parse(query).finditer(words)) == oracle(pattern, text, within), query
+
+
+def test_invalid_repetition():
+    assert parse('[obj="a"]{3,1}') is None
+    assert str(parse('[obj="a"]{0,1}[]+ within 3')) == '[obj="a"]? []+ within 3'
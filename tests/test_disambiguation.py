@@ -0,0 +1,38 @@
+import pytest
+
+from lingcorp.disambiguation import DisambiguationQueue
+
+
+def test_queue():
+    queue = DisambiguationQueue()
+    queue.add("r1", 0, "ri", ["go", "walk"], context="ri po")
+    queue.add("r1", 2, "ri", ["walk", "go"])  # same group
+    queue.add("r2", 1, "ri", ["go", "walk"])
+    queue.add("r2", 0, "po", ["thing", "hand"])
+    queue.add("r3", 0, "ri", ["go", "see"])
+    assert len(queue) == 5
+    ranked = queue.ranked()
+    assert [(form, candidates, len(x)) for form, candidates, x in ranked] == [
+        ("ri", ("go", "walk"), 3),
+        ("po", ("hand", "thing"), 1),
+        ("ri", ("go", "see"), 1),
+    ]
+    assert ranked[0][2][0] == (("r1", 0), {"context": "ri po"})
+    frame = queue.to_frame()
+    assert list(frame["tokens"]) == [3, 1, 1]
+    assert list(frame["records"]) == [2, 1, 1]
+    assert list(frame["cumulative"]) == pytest.approx([0.6, 0.8, 1.0])
+
+    queue.add("r3", 0, "ri", ["go", "walk"])  # re-queued in another group
+    assert len(queue) == 5
+    assert ("ri", ("go", "see")) not in queue.groups
+
+    decisions = queue.resolve(
+        "ri", ["walk", "go"], "go", overrides={("r1", 2): "walk", ("r2", 1): None}
+    )
+    assert sorted(decisions) == [("r1", 0, "go"), ("r1", 2, "walk"), ("r3", 0, "go")]
+    assert sorted(queue.contexts) == [("r2", 0), ("r2", 1)]
+    queue.discard_record("r2")
+    assert len(queue) == 0
+    assert not queue.groups and not queue.records
+    assert queue.to_frame().empty
@@ -0,0 +1,32 @@
+import os
+import stat
+
+import pandas as pd
+
+from lingcorp.export import Exporter
+
+
+def test_csv_export(tmp_path):
+    data = pd.DataFrame(
+        {"ID": ["a", "b"], "obj": [["po", "ri"], ["ka"]], "ann": ["x", "y"]}
+    )
+    path = tmp_path / "out" / "export.csv"
+    exporter = Exporter(path, list_cols=["obj"], drop=["ann"], chunksize=1)
+    exporter.write(data)
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "ID,obj",
+        "a,po\tri",
+        "b,ka",
+    ]
+    assert exporter.progress()["status"] == "done"
+    assert exporter.written == 2
+    assert not [x for x in path.parent.iterdir() if x.name.endswith(".tmp")]
+
+
+def test_export_file_mode(tmp_path):
+    umask = os.umask(0)
+    os.umask(umask)
+    path = tmp_path / "export.csv"
+    Exporter(path).write(pd.DataFrame({"ID": ["a"]}))
+    # not the owner-only mode of the temporary file
+    assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
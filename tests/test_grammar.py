@@ -0,0 +1,67 @@
+from writio import dump
+
+from lingcorp.grammar import GrammarSnapshot
+
+LEXEMES = """-lexeme
+ lex: po
+ stem: po.|pu.
+ gramm: N
+ paradigm: N
+ gloss: thing
+
+-lexeme
+ lex: ri
+ stem: ri.
+ gramm: V
+ paradigm: V
+ gloss: go
+
+-lexeme
+ lex: ka
+ stem: ka.
+ gramm: V
+ paradigm: V
+ gloss: see
+"""
+
+PARADIGMS = """-paradigm: N
+ -flex: .
+  gramm: sg
+
+-paradigm: V
+ -flex: .
+  gramm: prs
+"""
+
+FORMS = {"po": ["po"], "pun": ["po"], "ri": ["ri"], "kari": [], "ka": ["ka"]}
+
+
+def snapshot(path, lexemes=LEXEMES, paradigms=PARADIGMS, clitics=""):
+    path.mkdir(exist_ok=True)
+    (path / "lexemes.txt").write_text(lexemes)
+    (path / "paradigms.txt").write_text(paradigms)
+    (path / "clitics.txt").write_text(clitics)
+    return GrammarSnapshot.read(path)
+
+
+def test_affected_forms(tmp_path):
+    old = snapshot(tmp_path / "old")
+    assert snapshot(tmp_path / "same").affected_forms(old, FORMS) == set()
+    assert old.lexemes["po"]["stems"] == ["po", "pu"]
+    # a changed lexeme, and forms containing its stem
+    new = snapshot(tmp_path / "lex", lexemes=LEXEMES.replace("gloss: go", "gloss: run"))
+    assert new.affected_forms(old, FORMS) == {"ri", "kari"}
+    # a changed paradigm, and the forms of its lexemes
+    paradigms = PARADIGMS.replace("gramm: sg", "gramm: sg,nom")
+    new = snapshot(tmp_path / "paradigm", paradigms=paradigms)
+    assert new.affected_forms(old, FORMS) == {"po", "pun"}
+    # a removed lexeme
+    new = snapshot(tmp_path / "removed", lexemes=LEXEMES.split("\n\n")[0])
+    assert new.affected_forms(old, FORMS) == {"ri", "kari", "ka"}
+    # other grammar files may affect every form
+    assert (
+        snapshot(tmp_path / "clitics", clitics="x").affected_forms(old, FORMS) is None
+    )
+    dump(old.to_data(), tmp_path / "grammar.json")
+    restored = GrammarSnapshot.from_file(tmp_path / "grammar.json")
+    assert restored.to_data() == old.to_data()
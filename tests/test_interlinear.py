@@ -0,0 +1,50 @@
+from lingcorp.interlinear import InterlinearLayout, display_width
+
+LINES = [["ka", "porin", "ri"], ["see", "thing-PL", "go"], ["V", "N", "V"]]
+
+
+def pad_ex(*lines, sep=" "):
+    """The original alignment, by string length."""
+    out = {}
+    for bundle in zip(*lines):
+        longest = len(max(bundle, key=len))
+        for i, obj in enumerate(bundle):
+            out.setdefault(i, []).append(obj + " " * (longest - len(obj)))
+    return "\n".join(sep.join(x) for x in out.values())
+
+
+def test_layout_matches_padding():
+    for sep in [" ", "  "]:
+        layout = InterlinearLayout(*LINES, sep=sep)
+        assert layout.render() == pad_ex(*LINES, sep=sep)
+    assert InterlinearLayout().render() == ""
+
+
+def test_highlight_keeps_alignment():
+    layout = InterlinearLayout(*LINES)
+    assert layout.lines(1, mark=str.upper) == [
+        "ka  PORIN    ri",
+        "see THING-PL go",
+        "V   N        V ",
+    ]
+    assert layout.lines(1, mark=lambda s: f"<{s}>")[1] == "see <thing-PL> go"
+    assert layout.lines(3, mark=str.upper) == layout.lines()
+
+
+def test_display_width():
+    assert display_width("k\u00e4") == 2
+    assert display_width("ka\u0308") == 2  # combining diaeresis
+    assert display_width("\u5c71") == 2  # wide
+    layout = InterlinearLayout(["ka\u0308", "\u5c71"], ["see", "mountain"])
+    assert [display_width(x) for x in layout.lines()] == [12, 12]
+
+
+def test_preview():
+    layout = InterlinearLayout(*LINES)
+    assert layout.preview("po", "thing", "N") == [
+        "ka  porin    ri po   ",
+        "see thing-PL go thing",
+        "V   N        V  N    ",
+    ]
+    assert layout.render() == pad_ex(*LINES)
+    assert InterlinearLayout([], []).preview("a", "bc") == ["a ", "bc"]
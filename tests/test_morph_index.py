@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from lingcorp.helpers import (
+    MorphIndex,
+    get_morph_id,
+    sort_uniparser_column,
+    sort_uniparser_ids,
+)
+
+ID_DIC = {
+    "l1": {"po:thing": "l1-1", "pu:thing": "l1-2"},
+    "l2": {"ri:go": "l2-1"},
+    "l3": {"ri:walk": "l3-1"},
+    "s1": {"n:PL": "s1-1", "ri:LOC": "s1-2"},
+    "s2": {"n:PL": "s2-1"},
+}
+MORPHS = ["po:thing", "pu:thing", "ri:go", "ri:walk", "n:PL", "ri:LOC", "ka:see"]
+
+
+@pytest.mark.parametrize("mode", ["morphs", "morphemes"])
+def test_morph_index_matches_id_dic(mode):
+    rng = random.Random(0)
+    index = MorphIndex(ID_DIC)
+    for _ in range(500):
+        id_list = rng.sample(list(ID_DIC), rng.randint(0, 4))
+        obj, gloss = rng.choice(MORPHS).split(":")
+        assert index.get_morph_id(id_list, obj, gloss, mode) == get_morph_id(
+            id_list, ID_DIC, obj, gloss, mode
+        )
+    with pytest.raises(ValueError):
+        index.get_morph_id(["x1"], "po", "thing", mode)
+
+
+def test_sort_uniparser_column():
+    words = [
+        ("l1 s1", "po-n", "thing-PL"),
+        ("s1 l1", "po-n", "thing-PL"),
+        ("s2 s1 l2", "ri-n", "go-PL"),
+        ("s1 l3", "ri-ri", "walk-LOC"),
+        ("l1", "pu", "thing"),
+    ]
+    id_lists, objs, glosses = zip(*words)
+    expected = [
+        sort_uniparser_ids(x.split(), obj, gloss, ID_DIC) for x, obj, gloss in words
+    ]
+    assert expected[:2] == [["l1-1", "s1-1"]] * 2
+    assert expected[3] == ["l3-1", "s1-2"]
+    assert sort_uniparser_column(id_lists, objs, glosses, ID_DIC) == expected
+    assert sort_uniparser_column(
+        id_lists, objs, glosses, MorphIndex(ID_DIC), mode="morphemes"
+    ) == [
+        sort_uniparser_ids(x.split(), obj, gloss, ID_DIC, mode="morphemes")
+        for x, obj, gloss in words
+    ]
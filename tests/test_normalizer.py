@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from lingcorp.annotator import OrthoNormalizer
+
+ALPHABET = "abcAB-'"
+
+
+def ortho_strip(ortho_str, replace={}, strip=[]):
+    """The original, sequential normalization."""
+    for k, v in replace.items():
+        ortho_str = ortho_str.replace(k, v)
+    for p in strip:
+        ortho_str = ortho_str.replace(p, "")
+    return ortho_str.lower()
+
+
+def random_string(rng, max_len):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, max_len)))
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_normalizer_matches_sequential_replace(seed):
+    rng = random.Random(seed)
+    max_len = rng.choice([1, 1, 2, 3])  # single characters use str.translate
+    replace = {
+        random_string(rng, max_len): random_string(rng, max_len)[: rng.randint(0, 2)]
+        for _ in range(rng.randint(0, 4))
+    }
+    strip = [random_string(rng, max_len) for _ in range(rng.randint(0, 2))]
+    normalizer = OrthoNormalizer(replace, strip)
+    for _ in range(20):
+        text = random_string(rng, 12)
+        assert normalizer(text) == ortho_strip(text, replace, strip), (replace, strip)
+
+
+def test_normalizer_single_pass():
+    assert OrthoNormalizer({"A": "a", "-": ""}, ["'"]).single_pass
+    assert OrthoNormalizer({"ch": "c", "sh": "s"}, ["'"]).single_pass
+    assert not OrthoNormalizer({"a": "b", "b": "c"}).single_pass
+    deleting = OrthoNormalizer({"-": "", "ab": "x"})  # a-b becomes ab, then x
+    assert not deleting.single_pass
+    assert deleting("A-b a-b") == "ab x"
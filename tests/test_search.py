@@ -0,0 +1,138 @@
+import random
+import threading
+
+import pandas as pd
+import pytest
+
+from lingcorp import helpers
+from lingcorp.search import CorpusFrame, SharedWords, scan
+
+QUERIES = [
+    '[obj="po"][obj="ri"]',
+    '[gls="PL"]',
+    '[obj="ka"][]{0,2}[obj="po"] within 3',
+    '[obj="r*"]+',
+]
+
+
+@pytest.fixture(scope="module")
+def word_items():
+    rng = random.Random(0)
+    res = []
+    for i in range(400):
+        words = []
+        for idx in range(rng.randint(0, 12)):
+            word = {"obj": rng.choice(["po", "ri", "ka", "ru"]), "idx": idx, "i": i}
+            if rng.random() < 0.8:  # some words lack the attribute
+                word["gls"] = rng.choice([["thing", "PL"], "go", ["walk"]])
+            words.append(word)
+        res.append(words)
+    return res
+
+
+def test_shared_words_decode(word_items, tmp_path):
+    words = SharedWords.encode(word_items, tmp_path / "words.npy")
+    assert len(words) == len(word_items)
+    for rec_idx in [0, 7, 399]:
+        expected = [{"gls": "", **word} for word in word_items[rec_idx]]
+        assert words[rec_idx] == expected
+    words.close()
+
+
+def test_parallel_scan_matches_serial(word_items):
+    serial = scan(QUERIES, word_items, processes=1)
+    assert all(spans for spans, seconds in serial)
+    parallel = scan(QUERIES, word_items, processes=2, threshold=0)
+    assert [spans for spans, seconds in parallel] == [
+        spans for spans, seconds in serial
+    ]
+
+
+def test_parallel_scan_from_thread(word_items):
+    serial = scan(QUERIES, word_items, processes=1)
+    res = {}
+    thread = threading.Thread(
+        target=lambda: res.update(
+            spans=scan(QUERIES, word_items, processes=2, threshold=0)
+        )
+    )
+    thread.start()
+    thread.join()
+    assert [spans for spans, seconds in res["spans"]] == [
+        spans for spans, seconds in serial
+    ]
+
+
+def test_graid_list_fields_are_lists(monkeypatch):
+    parse_annotation = helpers.pygraid.parse_annotation
+
+    def with_lists(annotation, **kwargs):  # tags as lists, as some versions do
+        res = parse_annotation(annotation, **kwargs)
+        for item in res["pre"] + res["data"] + res["post"]:
+            for key in ["formtags", "functags", "formglosses"]:
+                if key in item:
+                    item[key] = item[key].split(".") if item[key] else []
+        return res
+
+    monkeypatch.setattr(helpers.pygraid, "parse_annotation", with_lists)
+    helpers.parse_graid_annotation.cache_clear()
+    record = {"rec": "r1", "spk": "a", "txt": "t", "lng": "x", "ftr": ""}
+    data = pd.DataFrame(
+        [
+            {
+                **record,
+                "obj": "ka\tpo",
+                "gls": "go\tPL",
+                "graid": "##\tv:pred_x",
+                "refind": "\t",
+            },
+            {
+                **record,
+                "obj": "ka",
+                "gls": "go",
+                "graid": "0.h:a v:pred_x",
+                "refind": "1",
+            },
+        ]
+    )
+    try:
+        graid = CorpusFrame(data).graid
+    finally:
+        helpers.parse_graid_annotation.cache_clear()
+    assert list(graid["functags"]) == ["", "", ["x"], "", ["x"]]
+    assert list(graid["formglosses"]) == ["", "", "", [], ""]
+
+
+def test_query_batch(server_project, tmp_path, monkeypatch):
+    monkeypatch.chdir(server_project[0])  # build_conc_line needs the conf module
+    monkeypatch.setattr(CorpusFrame, "conc_dir", tmp_path)
+    record = {"spk": "a", "txt": "t", "lng": "x", "ftr": "A translation."}
+    data = pd.DataFrame(
+        [
+            {**record, "rec": "r1", "obj": "po\tri\tka", "gls": "thing\tgo\tPL"},
+            {**record, "rec": "r2", "obj": "ka\tpo\tri", "gls": "PL\tthing\tgo"},
+            {**record, "rec": "r3", "obj": "ri", "gls": "go"},
+        ]
+    )
+    df = CorpusFrame(data)
+    queries = {
+        "po_ri": '[obj="po"][obj="ri"]',
+        "plural": '[gls="PL"]',
+        "word": "ka",  # a plain word form
+        "none": '[obj="zz"]',
+        "invalid": '[obj="po"]{3,1}',
+    }
+    summary = df.query_batch(queries, conc_mode="csv", processes=1)
+    assert {name: res["hits"] for name, res in summary.items()} == {
+        "po_ri": 2,
+        "plural": 2,
+        "word": 2,
+        "none": 0,
+        "invalid": 0,
+    }
+    assert summary["word"]["query"] == '[obj="ka"]'
+    assert "error" in summary["invalid"]
+    assert "path" not in summary["none"]
+    hits = pd.read_csv(summary["po_ri"]["path"])
+    assert list(hits["Record"]) == ["r1", "r2"]
+    assert list(hits["Hit"]) == ["po ri"] * 2
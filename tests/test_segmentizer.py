@@ -0,0 +1,37 @@
+import pandas as pd
+
+from lingcorp.annotator import Segmentizer
+from lingcorp.config import ID_KEY
+from lingcorp.helpers import run_pipeline
+
+SEGMENTS = [
+    {"Grapheme": "sh", "IPA": "ʃ"},
+    {"Grapheme": "a", "IPA": "a"},
+    {"Grapheme": "k", "IPA": "k"},
+    {"Grapheme": "i", "IPA": "i"},
+]
+
+
+def test_run_pipeline_converts_columns():
+    data = pd.DataFrame(
+        {
+            ID_KEY: ["a", "b", "c", "d"],
+            "Orthographic": ["shaki kaki", "kaxi shaki", "kaxi", ""],
+            "Words": [["shaki", "kaki"], ["kaxi"], ["kaxi shaki"], []],
+        }
+    )
+    pipeline = [
+        Segmentizer(segments=SEGMENTS, name="string"),
+        Segmentizer(segments=SEGMENTS, name="list", parse_col="Words", output_col="X"),
+    ]
+    res = run_pipeline(data.copy(), {}, pipeline, pos_list=[])
+    expected = [
+        Segmentizer(segments=SEGMENTS, parse_col=col, output_col=col).parse(rec)
+        for col in ["Orthographic", "Words"]
+        for rec in data.to_dict("records")
+    ]
+    assert list(res["IPA"]) == [rec["Orthographic"] for rec in expected[:4]]
+    assert list(res["X"]) == [rec["Words"] for rec in expected[4:]]
+    assert res["IPA"]["a"] == "ʃ a k i # k a k i"
+    for item in pipeline:
+        assert dict(item.unconvertible_counts) == {"kaxi": 2}
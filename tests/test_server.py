@@ -0,0 +1,98 @@
+import copy
+import threading
+
+
+def word_edit(server, r_id, pos, value):
+    """An edit of the GRAID annotation of word `pos` in `r_id`."""
+    return {"target": f"{r_id}_graid_{pos}", "value": value}
+
+
+def test_batch_update(server):
+    client = server.app.test_client()
+    r_id = server.data.index[0]
+    response = client.post(
+        "/batch_update", json={"edits": [word_edit(server, r_id, 1, "np:p")]}
+    )
+    assert response.status_code == 200
+    assert list(server.annotations["graid"][r_id][1].values()) == ["np:p"]
+
+
+def test_batch_update_rejects_unknown_records_and_fields(server):
+    client = server.app.test_client()
+    r_id = server.data.index[0]
+    for edit in [
+        {"rec": "nonexistent", "key": "graid", "pos": 0, "value": "np:s"},
+        {"rec": r_id, "key": "nonexistent", "value": "x"},
+        {"target": "malformed"},
+    ]:
+        response = client.post(
+            "/batch_update",
+            json={"edits": [word_edit(server, r_id, 0, "## np:s"), edit]},
+        )
+        assert response.status_code == 400
+        assert response.get_json()["edit"] == edit
+
+
+def test_batch_update_rolls_back(server):
+    client = server.app.test_client()
+    first, second = server.data.index[:2]
+    records = {
+        r_id: copy.deepcopy(dict(server.data.loc[r_id])) for r_id in [first, second]
+    }
+    annotations = copy.deepcopy(server.annotations["graid"])
+    edits = [
+        word_edit(server, first, 1, "pro.h:a"),
+        word_edit(server, second, 999, "np:s"),  # fails after the first
+    ]
+    response = client.post("/batch_update", json={"edits": edits})
+    assert response.status_code == 500
+    for r_id, rec in records.items():
+        assert dict(server.data.loc[r_id]) == rec
+    assert server.annotations["graid"] == annotations
+
+
+def test_textpage_prefetches_each_window_once(server, monkeypatch):
+    client = server.app.test_client()
+    server.rendered.clear()
+    calls = []
+    get_record = server.get_record
+    monkeypatch.setattr(
+        server, "get_record", lambda r_id: calls.append(r_id) or get_record(r_id)
+    )
+    text_id = next(iter(server.texts))
+    threads = threading.active_count()
+    for _ in range(10):
+        response = client.get("/textpage", query_string={"textID": text_id, "size": 5})
+        assert response.status_code == 200
+    server.prefetcher.submit(lambda: None).result()  # wait for the prefetcher
+    assert threading.active_count() <= threads + 1
+    assert sorted(calls) == sorted(set(calls))
+    assert all(r_id in server.rendered for r_id in server.texts[text_id][:10])
+
+
+def test_resolve(server):
+    client = server.app.test_client()
+    queue = client.get("/disambiguation", query_string={"top": 1}).get_json()
+    assert queue["groups"]  # the synthetic corpus has ambiguous forms
+    group = queue["groups"][0]
+    response = client.post(
+        "/resolve",
+        json={
+            "form": group["form"],
+            "candidates": group["candidates"],
+            "choice": group["candidates"][0],
+        },
+    )
+    assert response.get_json()["resolved"] == group["tokens"]
+    response = client.post("/resolve", json={"form": group["form"]})
+    assert response.status_code == 400
+
+
+def test_disambiguation_without_uniparser(server, monkeypatch):
+    client = server.app.test_client()
+    monkeypatch.setattr(server, "uniparser", None)
+    assert client.get("/disambiguation").status_code == 404
+    response = client.post(
+        "/resolve", json={"form": "x", "candidates": ["a", "b"], "choice": "a"}
+    )
+    assert response.status_code == 404
@@ -0,0 +1,44 @@
+import atexit
+import json
+
+from writio import load
+
+from lingcorp.session import SessionStore
+
+
+def store(tmp_path, data):
+    def apply(op, key, value):
+        if op == "set":
+            data[key] = value
+        else:
+            data.pop(key, None)
+
+    res = SessionStore(tmp_path / "session.log", apply, every=3, interval=0)
+    res.register(tmp_path / "answers.json", lambda: data)
+    return res
+
+
+def test_journal_replay(tmp_path):
+    data = {}
+    session = store(tmp_path, data).start()
+    session.record("set", "a", 1)
+    session.record_many([("set", "b", 2), ("set", "c", 3)])  # flushed
+    assert load(tmp_path / "answers.json") == {"a": 1, "b": 2, "c": 3}
+    session.record("set", "d", 4)
+    session.record("del", "a", None)
+    assert load(tmp_path / "answers.json") == {"a": 1, "b": 2, "c": 3}
+    # the session crashes, in the middle of writing a change
+    session._journal.write('["set", "e"')
+    session._journal.close()
+    atexit.unregister(session.close)
+
+    data = load(tmp_path / "answers.json")
+    session = store(tmp_path, data).start()
+    assert data == {"b": 2, "c": 3, "d": 4}
+    assert load(tmp_path / "answers.json") == data
+    assert (tmp_path / "session.log").read_text() == ""
+    session.record("set", "e", 5)
+    assert json.loads((tmp_path / "session.log").read_text()) == ["set", "e", 5]
+    session.close()
+    assert load(tmp_path / "answers.json") == {"b": 2, "c": 3, "d": 4, "e": 5}
+    assert not (tmp_path / "session.log").exists()
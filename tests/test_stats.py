@@ -0,0 +1,17 @@
+import pandas as pd
+
+from lingcorp import stats
+
+
+def test_collocations_rank_attraction_above_repulsion():
+    # "ka" is always followed by "po"; "ri" is frequent, but rarely near "ka"
+    records = [["ka", "po", f"a{n}", f"b{n}", "c", "d", "ri"] for n in range(20)]
+    records += [["ka", "ri", "c", "d"]] * 2
+    records += [["ri", "ri", "ri", "ri"]] * 30
+    words = stats.word_table(pd.DataFrame({"obj": records}), ["obj"])
+    res = stats.collocations(words, "obj", "ka", window=3).set_index("obj")
+    assert res.index[0] == "po"
+    assert res.loc["po", "ll"] > 0
+    assert res.loc["ri", "observed"] < res.loc["ri", "expected"]
+    assert res.loc["ri", "ll"] < 0
+    assert res.index[-1] == "ri"